@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный HTTP/1.1 фронтенд для обработчиков http.server: keep-alive,
+ограничение числа соединений и рабочих потоков, обратное давление при записи.
+Соединения, разбор запросов и ожидание клиентов - в цикле asyncio, сами
+обработчики (BaseHTTPRequestHandler) - в пуле потоков, поэтому маршруты
+и их код не меняются. Простаивающее keep-alive соединение потока не занимает.
+
+Длинный ответ (поток событий) обработчик может отдать циклу событий: отправить
+заголовки и записать в self.async_stream корутину-функцию stream(send). Поток
+пула освобождается, а stream пишет в соединение через await send(data), пока
+клиент не уйдёт; после неё соединение закрывается.
+"""
+
+import asyncio
+import io
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_CONNECTIONS = 1000  # сверх этого новые соединения получают 503
+WORKERS = 32  # потоков для обработчиков; остальные запросы ждут в очереди
+KEEPALIVE_TIMEOUT = 15  # сек, сколько держим простаивающее соединение
+HEADER_TIMEOUT = 10  # сек на заголовки и тело запроса
+MAX_HEADER = 64 * 1024
+MAX_BODY = 16 * 1024 * 1024
+WRITE_BUFFER = 64 * 1024  # мелкие записи обработчика копятся до этого размера
+HIGH_WATER = 256 * 1024  # выше этого буфера сокета обработчик ждёт, пока клиент заберёт данные
+WRITE_TIMEOUT = 60  # сек; клиент, не забирающий данные так долго, отключается
+SENDFILE_CHUNK = 1024 * 1024  # sendfile идёт частями, таймаут - на каждую
+
+
+def _simple_response(status, reason, body=b""):
+    return (f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("latin-1") + body
+
+
+async def _drain(writer, aw=None):
+    """Ждёт drain (или aw) не дольше WRITE_TIMEOUT; зависшее соединение обрывается"""
+    try:
+        await asyncio.wait_for(aw if aw is not None else writer.drain(), WRITE_TIMEOUT)
+    except asyncio.TimeoutError:
+        writer.transport.abort()
+        raise ConnectionResetError("client stopped reading") from None
+
+
+class _ResponseWriter:
+    """wfile обработчика: пишет в сокет через цикл событий и ждёт drain (обратное давление)"""
+
+    def __init__(self, loop, writer):
+        self._loop = loop
+        self._writer = writer
+        self._buf = bytearray()
+        self._head = bytearray()
+        self.head = None  # строка статуса и заголовки ответа
+
+    def write(self, data):
+        if self.head is None:
+            self._head += data
+            end = self._head.find(b"\r\n\r\n")
+            if end >= 0:
+                self.head = bytes(self._head[:end])
+                self._head = None
+        self._buf += data
+        if len(self._buf) >= WRITE_BUFFER:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._buf:
+            return
+        data = bytes(self._buf)
+        self._buf.clear()
+        asyncio.run_coroutine_threadsafe(self._send(data), self._loop).result()
+
+    def sendfile(self, f, offset, count):
+        """Отдаёт часть файла через loop.sendfile (os.sendfile, если транспорт позволяет)"""
+        self.flush()
+        asyncio.run_coroutine_threadsafe(self._sendfile(f, offset, count), self._loop).result()
+
+    async def _sendfile(self, f, offset, count):
+        if self._writer.is_closing():
+            raise ConnectionResetError("client disconnected")
+        await _drain(self._writer)
+        end = offset + count
+        while offset < end:
+            size = min(SENDFILE_CHUNK, end - offset)
+            await _drain(self._writer, self._loop.sendfile(self._writer.transport, f, offset, size))
+            offset += size
+
+    async def _send(self, data):
+        if self._writer.is_closing():
+            raise ConnectionResetError("client disconnected")
+        self._writer.write(data)
+        await _drain(self._writer)
+
+    def delimited(self, command):
+        """Может ли клиент найти конец ответа без закрытия соединения"""
+        if not self.head:
+            return False
+        lines = self.head.split(b"\r\n")
+        try:
+            status = int(lines[0].split()[1])
+        except (IndexError, ValueError):
+            return False
+        if status < 200 or status in (204, 304) or command == "HEAD":
+            return True
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length" or (name == b"transfer-encoding" and b"chunked" in value.lower()):
+                return True
+        return False
+
+
+class AsyncHTTPServer:
+    """
+    Сервер для handler_class (подкласс BaseHTTPRequestHandler): каждый запрос
+    читается целиком в цикле событий и передаётся обработчику в пуле потоков
+    """
+
+    def __init__(self, address, handler_class, max_connections=MAX_CONNECTIONS, workers=WORKERS,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT):
+        self.server_address = address
+        self.handler_class = handler_class
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+        self.connections = 0
+        self._server = None
+
+    async def _read_request(self, reader, writer, timeout):
+        """(сырой запрос для обработчика, метод) или None, если соединение пора закрыть"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.LimitOverrunError:
+            writer.write(_simple_response(431, "Request Header Fields Too Large"))
+            return None
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        head = head.lstrip(b"\r\n")  # пустые строки между запросами допустимы
+        lines = head.split(b"\r\n")
+        method = lines[0].split(b" ", 1)[0].decode("latin-1")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+
+        if b"chunked" in headers.get(b"transfer-encoding", b"").lower():
+            writer.write(_simple_response(501, "Not Implemented", b"Chunked request bodies are not supported"))
+            return None
+        try:
+            length = int(headers.get(b"content-length", 0))
+        except ValueError:
+            writer.write(_simple_response(400, "Bad Request"))
+            return None
+        if length > MAX_BODY:
+            writer.write(_simple_response(413, "Payload Too Large"))
+            return None
+
+        if headers.get(b"expect", b"").lower() == b"100-continue":
+            # Отвечаем сами: тело читается до вызова обработчика
+            lines = [line for line in lines if not line.lower().startswith(b"expect:")]
+            head = b"\r\n".join(lines)
+            if length:
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        body = b""
+        if length:
+            try:
+                body = await asyncio.wait_for(reader.readexactly(length), HEADER_TIMEOUT)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                return None
+        return head + body, method
+
+    async def _serve_connection(self, reader, writer):
+        if self.connections >= self.max_connections:
+            writer.write(_simple_response(503, "Service Unavailable", b"Too many connections"))
+            writer.close()
+            return
+        self.connections += 1
+        writer.transport.set_write_buffer_limits(high=HIGH_WATER)
+        peer = writer.get_extra_info("peername") or ("", 0)
+        loop = asyncio.get_running_loop()
+        timeout = HEADER_TIMEOUT
+        try:
+            while True:
+                request = await self._read_request(reader, writer, timeout)
+                if request is None:
+                    break
+                raw, method = request
+                keep_alive, stream = await loop.run_in_executor(self.executor, self._handle, loop, writer,
+                                                                raw, method, peer)
+                if stream:
+                    await self._run_stream(stream, writer)
+                    break
+                if not keep_alive:
+                    break
+                timeout = self.keepalive_timeout
+        finally:
+            self.connections -= 1
+            try:
+                await _drain(writer)
+            except ConnectionError:
+                pass
+            writer.close()
+
+    @staticmethod
+    async def _run_stream(stream, writer):
+        async def send(data):
+            if writer.is_closing():
+                raise ConnectionResetError("client disconnected")
+            writer.write(data)
+            await _drain(writer)
+
+        try:
+            await stream(send)
+        except OSError:
+            pass  # клиент ушёл
+        except Exception:
+            traceback.print_exc()
+
+    def _handle(self, loop, writer, raw, method, peer):
+        """
+        Вызов обработчика в рабочем потоке: (можно ли оставить соединение
+        открытым, корутина-функция потокового ответа или None)
+        """
+        wfile = _ResponseWriter(loop, writer)
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.request = handler.connection = None
+        handler.client_address = peer[:2]
+        handler.directory = os.getcwd()  # для SimpleHTTPRequestHandler, как в его __init__
+        handler.rfile = io.BytesIO(raw)
+        handler.wfile = wfile
+        handler.protocol_version = "HTTP/1.1"
+        handler.close_connection = True
+        handler.async_stream = None
+        try:
+            handler.handle_one_request()
+            wfile.flush()
+        except OSError:
+            # Клиент ушёл посреди ответа
+            return False, None
+        except Exception:
+            traceback.print_exc()
+            return False, None
+        if handler.async_stream:
+            return False, handler.async_stream
+        return not handler.close_connection and wfile.delimited(method), None
+
+    async def serve(self):
+        host, port = self.server_address
+        self._server = await asyncio.start_server(self._serve_connection, host, port,
+                                                  limit=MAX_HEADER, backlog=1024)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.executor.shutdown(wait=False)
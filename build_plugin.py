@@ -48,6 +48,7 @@ def build_plugin():
         "--distpath", "static/publish",  # В папку publish
         "--workpath", build_dir,
         "--specpath", ".",
+        "--add-data", f"static/files-db.json{os.pathsep}static",  # встроенный каталог моделей
         "plugin_service.py"
     ]
     
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Поиск принтеров в подсетях: асинхронный обход портов с ограничением
+скорости и определение производителя и модели по IPP, PJL или HTTP
+"""
+
+import asyncio
+import ipaddress
+import re
+import struct
+import time
+
+SWEEP_PORTS = (9100, 631, 80)
+CONNECT_TIMEOUT = 0.3
+CONNECT_RATE = 2000  # подключений в секунду на весь обход
+MAX_INFLIGHT = 512  # одновременных подключений на весь обход (~CONNECT_RATE * CONNECT_TIMEOUT)
+SUBNET_INFLIGHT = 512  # одновременных подключений на одну подсеть, но не больше её проверок
+MIN_PREFIX = 22  # самая большая подсеть для обхода - /22 (1022 адреса), только IPv4
+FINGERPRINT_TIMEOUT = 2.0
+RESPONSE_LIMIT = 64 * 1024
+
+# Порт каждого способа определения модели (для тестов подставляются свои)
+FINGERPRINT_PORTS = {"ipp": 631, "pjl": 9100, "http": 80}
+
+VENDORS = ("Kyocera", "Canon", "HP", "Hewlett-Packard", "Brother", "Xerox", "Ricoh",
+           "Lexmark", "Epson", "Samsung", "Konica Minolta", "Sharp", "OKI", "Pantum")
+
+UEL = b"\x1b%-12345X"
+
+
+class RateLimiter:
+    """Маркерное ведро: не больше rate событий в секунду"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = float(rate)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def _port_open(ip, port, timeout, limiter, slots) -> bool:
+    async with slots:
+        await limiter.acquire()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+
+def parse_networks(networks, min_prefix=MIN_PREFIX) -> list:
+    """Подсети из CIDR-строк; ValueError для IPv6 и подсетей больше /min_prefix"""
+    nets = []
+    for n in networks:
+        net = ipaddress.ip_network(n, strict=False)
+        if net.version != 4:
+            raise ValueError(f"{n}: only IPv4 subnets are supported")
+        if net.prefixlen < min_prefix:
+            raise ValueError(f"{n}: subnet is larger than /{min_prefix}")
+        nets.append(net)
+    return nets
+
+
+async def sweep(networks, ports=SWEEP_PORTS, timeout=CONNECT_TIMEOUT, rate=CONNECT_RATE,
+                max_inflight=MAX_INFLIGHT, subnet_inflight=SUBNET_INFLIGHT, min_prefix=MIN_PREFIX) -> dict:
+    """ip -> список открытых портов для всех адресов подсетей (CIDR-строки)"""
+    nets = parse_networks(networks, min_prefix)
+    limiter = RateLimiter(rate)
+    slots = asyncio.Semaphore(max_inflight)
+    found = {}
+
+    async def sweep_subnet(net):
+        # Адреса перебираются по мере проверки: на подсеть не больше subnet_inflight корутин
+        count = net.num_addresses - 2 if net.num_addresses > 2 else net.num_addresses
+        hosts = net.hosts() if net.num_addresses > 2 else iter(net)
+        checks = ((str(ip), port) for ip in hosts for port in ports)
+        workers = min(subnet_inflight, count * len(ports))
+
+        async def worker():
+            for ip, port in checks:
+                if await _port_open(ip, port, timeout, limiter, slots):
+                    found.setdefault(ip, []).append(port)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+    await asyncio.gather(*(sweep_subnet(net) for net in nets))
+    return found
+
+
+async def _exchange(ip, port, payload: bytes, timeout=FINGERPRINT_TIMEOUT) -> bytes:
+    """Отправляет запрос и читает ответ до закрытия соединения (не больше RESPONSE_LIMIT)"""
+    async def run():
+        reader, writer = await asyncio.open_connection(ip, port)
+        try:
+            writer.write(payload)
+            await writer.drain()
+            data = b""
+            while len(data) < RESPONSE_LIMIT:
+                chunk = await reader.read(RESPONSE_LIMIT - len(data))
+                if not chunk:
+                    break
+                data += chunk
+            return data
+        finally:
+            writer.close()
+    return await asyncio.wait_for(run(), timeout)
+
+
+def _http_request(method, host, path, body=b"", content_type=None) -> bytes:
+    head = [f"{method} {path} HTTP/1.0", f"Host: {host}", "Connection: close"]
+    if content_type:
+        head.append(f"Content-Type: {content_type}")
+    if body:
+        head.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("ascii") + body
+
+
+def _split_http(data: bytes):
+    head, _, body = data.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("latin-1").split("\r\n")[1:]:
+        k, _, v = line.partition(":")
+        headers[k.strip().lower()] = v.strip()
+    return headers, body
+
+
+def split_make_model(text: str) -> dict:
+    """'KYOCERA ECOSYS P3145dn' -> {'vendor': 'Kyocera', 'model': 'ECOSYS P3145dn'}"""
+    text = " ".join(text.split())
+    for vendor in VENDORS:
+        m = re.search(rf"\b{re.escape(vendor)}\b", text, re.IGNORECASE)
+        if m:
+            model = text[m.end():].strip(" -:,")
+            return {"vendor": vendor, "model": model}
+    return {"vendor": "", "model": text}
+
+
+def ipp_request(uri: str, attributes=("printer-make-and-model", "printer-name")) -> bytes:
+    """Тело запроса IPP Get-Printer-Attributes"""
+    def attr(tag, name, value):
+        n, v = name.encode("ascii"), value.encode("utf-8")
+        return struct.pack(">BH", tag, len(n)) + n + struct.pack(">H", len(v)) + v
+
+    out = struct.pack(">BBHI", 1, 1, 0x000B, 1) + b"\x01"
+    out += attr(0x47, "attributes-charset", "utf-8")
+    out += attr(0x48, "attributes-natural-language", "en")
+    out += attr(0x45, "printer-uri", uri)
+    for i, name in enumerate(attributes):
+        out += attr(0x44, "requested-attributes" if i == 0 else "", name)
+    return out + b"\x03"
+
+
+def parse_ipp_attributes(body: bytes) -> dict:
+    """Имя атрибута -> первое значение (строкой) из ответа IPP"""
+    attrs, pos = {}, 8
+    while pos < len(body):
+        tag = body[pos]
+        pos += 1
+        if tag == 0x03:
+            break
+        if tag < 0x10:
+            continue
+        if pos + 2 > len(body):
+            break
+        (name_len,) = struct.unpack_from(">H", body, pos)
+        name = body[pos + 2:pos + 2 + name_len].decode("utf-8", "replace")
+        pos += 2 + name_len
+        if pos + 2 > len(body):
+            break
+        (value_len,) = struct.unpack_from(">H", body, pos)
+        value = body[pos + 2:pos + 2 + value_len]
+        pos += 2 + value_len
+        if name:
+            attrs.setdefault(name, value.decode("utf-8", "replace"))
+    return attrs
+
+
+async def fingerprint_ipp(ip, port) -> dict:
+    path = "/ipp/print"
+    body = ipp_request(f"ipp://{ip}:{port}{path}")
+    data = await _exchange(ip, port, _http_request("POST", f"{ip}:{port}", path, body, "application/ipp"))
+    _, ipp = _split_http(data)
+    attrs = parse_ipp_attributes(ipp)
+    if not attrs.get("printer-make-and-model"):
+        return {}
+    result = split_make_model(attrs["printer-make-and-model"])
+    result["host"] = attrs.get("printer-name", "")
+    return result
+
+
+async def fingerprint_pjl(ip, port) -> dict:
+    data = await _exchange(ip, port, UEL + b"@PJL INFO ID\r\n" + UEL)
+    m = re.search(rb'"([^"\r\n]+)"', data) or re.search(rb"@PJL INFO ID\r?\n([^\r\n\x0c]+)", data)
+    return split_make_model(m.group(1).decode("latin-1")) if m else {}
+
+
+async def fingerprint_http(ip, port) -> dict:
+    data = await _exchange(ip, port, _http_request("GET", f"{ip}:{port}", "/"))
+    headers, body = _split_http(data)
+    title = re.search(rb"<title[^>]*>(.*?)</title>", body, re.IGNORECASE | re.DOTALL)
+    for text in (title.group(1).decode("utf-8", "replace") if title else "", headers.get("server", "")):
+        result = split_make_model(text)
+        if result["vendor"]:
+            return result
+    return {}
+
+
+FINGERPRINTERS = (("ipp", fingerprint_ipp), ("pjl", fingerprint_pjl), ("http", fingerprint_http))
+
+
+async def fingerprint(ip, open_ports, fingerprint_ports=None) -> dict:
+    """Производитель и модель по первому ответившему способу: IPP, затем PJL, затем HTTP"""
+    fp_ports = fingerprint_ports or FINGERPRINT_PORTS
+    for name, func in FINGERPRINTERS:
+        port = fp_ports.get(name)
+        if port not in open_ports:
+            continue
+        try:
+            result = await func(ip, port)
+        except (OSError, asyncio.TimeoutError, ValueError, struct.error):
+            continue
+        if result.get("model"):
+            return dict(result, source=name)
+    return {}
+
+
+async def discover_async(networks, ports=SWEEP_PORTS, fingerprint_ports=None, **sweep_kwargs) -> list:
+    found = await sweep(networks, ports, **sweep_kwargs)
+    ips = sorted(found, key=ipaddress.ip_address)
+    infos = await asyncio.gather(*(fingerprint(ip, found[ip], fingerprint_ports) for ip in ips))
+    return [dict(info, ip=ip, ports=sorted(found[ip])) for ip, info in zip(ips, infos)]
+
+
+def discover(networks, **kwargs) -> list:
+    """Найденные устройства: [{'ip', 'ports', 'vendor', 'model', 'host', 'source'}]"""
+    return asyncio.run(discover_async(networks, **kwargs))
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Поиск принтеров в подсетях")
+    parser.add_argument("networks", nargs="+", help="подсети CIDR, например 192.168.0.0/24")
+    parser.add_argument("--rate", type=float, default=CONNECT_RATE, help="подключений в секунду")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    devices = discover(args.networks, rate=args.rate)
+    print(json.dumps(devices, ensure_ascii=False, indent=2))
+    print(f"{len(devices)} devices in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,642 @@
+# -*- coding: utf-8 -*-
+"""
+Сборка и кэширование архивов драйверов для /dl/drivers
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import struct
+import threading
+import zipfile
+import zlib
+import contextlib
+import collections
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import inf_parser
+
+logger = logging.getLogger(__name__)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "bundle_cache")
+CACHE_MAX_BYTES = 1024 * 1024 * 1024  # лимит кэша архивов на диске (1 ГБ)
+FINGERPRINT_TTL = 5.0  # сколько секунд доверяем последнему обходу дерева
+STREAM_CHUNK = 64 * 1024  # размер блока чтения и отправки
+DEFLATE_LEVEL = 6
+FAST_DEFLATE_LEVEL = 1
+ZIP32_LIMIT = 0xFFFFFFFF
+BUNDLE_WORKERS = os.cpu_count() or 1  # потоков сжатия при сборке архива
+MEMBER_BUFFER_LIMIT = 8 * 1024 * 1024  # файлы крупнее сжимаются потоково, без пула
+
+# Политика сжатия: уже сжатые форматы сохраняются как есть, текст всегда сжимается,
+# остальное оценивается по образцам
+STORED_EXTENSIONS = {".cab", ".zip", ".7z", ".gz", ".png", ".jpg", ".jpeg", ".gif"}
+DEFLATE_EXTENSIONS = {".inf", ".ini", ".xml", ".txt", ".rtf", ".hta", ".htm", ".html", ".pnf", ".config"}
+SAMPLE_SIZE = 16 * 1024  # размер каждого из трёх образцов (начало, середина, конец)
+SMALL_FILE = 4 * 1024  # мелкие файлы сжимаются без оценки
+STORE_RATIO = 0.90  # если образец сжимается хуже, файл сохраняется без сжатия
+FAST_RATIO = 0.60  # между FAST_RATIO и STORE_RATIO хватает быстрого уровня
+COMPRESSION_POLICY = "adaptive-1"
+# Манифест расположения файлов - первый файл каждого архива
+BUNDLE_MANIFEST = "manifest.json"
+LAYOUT_VERSION = 1  # входит в ключ кэша: смена политики пересобирает архивы
+
+_fp_lock = threading.Lock()
+_fp_memo = {}  # root -> (время расчёта, отпечаток)
+_method_lock = threading.Lock()
+_method_memo = {}  # (путь, размер, mtime) -> (метод, уровень)
+_hash_lock = threading.Lock()
+_hash_memo = {}  # (путь, размер, mtime) -> sha256
+
+
+def tree_fingerprint(root: str) -> str:
+    """Отпечаток дерева файлов: относительный путь, размер и mtime каждого файла"""
+    now = time.monotonic()
+    with _fp_lock:
+        memo = _fp_memo.get(root)
+        if memo and now - memo[0] < FINGERPRINT_TTL:
+            return memo[1]
+
+    h = hashlib.sha1()
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            h.update(f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    fp = h.hexdigest()
+
+    with _fp_lock:
+        _fp_memo[root] = (now, fp)
+    return fp
+
+
+def bundle_key(fingerprint: str, *recipe) -> str:
+    """Ключ архива: отпечаток дерева плюс параметры сборки"""
+    h = hashlib.sha1(fingerprint.encode("ascii"))
+    for part in recipe:
+        h.update(b"\0" + str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+def tree_files(root: str) -> list:
+    """Все файлы дерева root в виде относительных путей"""
+    result = []
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            result.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return result
+
+
+def bundle_files(vendor_root: str, inf_relpath: str, driver_name: str, extra_dirs=()) -> list:
+    """
+    Файлы архива для одной модели: замыкание драйвера по INF плюс
+    дополнительные папки (например, для сканера). Пути - от vendor_root.
+    FileNotFoundError, если INF ссылается на файлы, которых нет в дереве.
+    """
+    inf_path = os.path.join(vendor_root, inf_relpath)
+    inf_dir = os.path.dirname(inf_relpath)
+    missing = []
+    files = [os.path.join(inf_dir, rel) for rel in inf_parser.driver_file_closure(inf_path, driver_name,
+                                                                                  missing=missing)]
+    if missing:
+        # Установка из неполного архива не пройдёт; имена в INF могут не совпадать
+        # с раскладкой дерева, поэтому решает вызывающий (BundleRecipe берёт всё дерево)
+        shown = ", ".join(missing[:5]) + (f" and {len(missing) - 5} more" if len(missing) > 5 else "")
+        raise FileNotFoundError(f"{inf_relpath} references {len(missing)} files missing from the tree: {shown}")
+    for extra in extra_dirs:
+        extra_path = os.path.join(vendor_root, extra)
+        if os.path.isdir(extra_path):
+            files.extend(os.path.join(extra, rel) for rel in tree_files(extra_path))
+    return files
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 файла; результат запоминается до изменения размера или mtime"""
+    st = os.stat(path)
+    memo_key = (path, st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hash_memo[memo_key] = digest
+    return digest
+
+
+class BundleRecipe:
+    """
+    Состав архива драйверов модели: дерево производителя, INF, имя драйвера,
+    доп. папки и расположение пакета сканера (twain_msi, quick_scan - пути через '/')
+    """
+
+    def __init__(self, root: str, inf_relpath: str, driver_name: str, extra_dirs=(),
+                 twain_msi: str = "", quick_scan: str = ""):
+        self.root = root
+        self.inf_relpath = inf_relpath
+        self.driver_name = driver_name
+        self.extra_dirs = tuple(extra_dirs)
+        self.twain_msi = twain_msi
+        self.quick_scan = quick_scan
+        self._files = None
+
+    def key(self) -> str:
+        """Ключ архива: меняется вместе с деревом, составом, политикой сжатия и форматом манифеста"""
+        return bundle_key(tree_fingerprint(self.root), os.path.basename(self.root), self.driver_name,
+                          COMPRESSION_POLICY, LAYOUT_VERSION, self.twain_msi, self.quick_scan, *self.extra_dirs)
+
+    def layout(self) -> dict:
+        """Расположение драйвера и пакета сканера в архиве; отсутствующие части - None"""
+        files = {rel.replace(os.sep, "/") for rel in self.files()}
+        inf = self.inf_relpath.replace(os.sep, "/")
+        quick_scan = self.quick_scan.rstrip("/")
+        return {
+            "version": LAYOUT_VERSION,
+            "driver": self.driver_name,
+            "driver_root": inf.rsplit("/", 1)[0] if "/" in inf else "",
+            "inf": inf,
+            "twain_msi": self.twain_msi if self.twain_msi in files else None,
+            "quick_scan": quick_scan if quick_scan and any(f.startswith(quick_scan + "/") for f in files) else None,
+        }
+
+    def prelude(self) -> list:
+        """Служебные файлы в начале архива: [(имя, mtime, данные)]"""
+        data = json.dumps(self.layout(), ensure_ascii=False, sort_keys=True, indent=1).encode("utf-8")
+        return [(BUNDLE_MANIFEST, os.path.getmtime(os.path.join(self.root, self.inf_relpath)), data)]
+
+    def files(self) -> list:
+        """Относительные пути файлов архива (всё дерево, если INF не удалось разобрать)"""
+        if self._files is None:
+            try:
+                self._files = bundle_files(self.root, self.inf_relpath, self.driver_name, self.extra_dirs)
+            except (KeyError, OSError) as e:
+                logger.warning("INF closure failed for %s: %s; packing whole tree", self.driver_name, e)
+                self._files = tree_files(self.root)
+        return self._files
+
+    def entries(self, files=None) -> list:
+        return plan_entries(self.root, self.files() if files is None else files)
+
+    def manifest(self) -> dict:
+        """Список файлов архива с размерами и SHA-256 для синхронизации на клиенте"""
+        items = []
+        for rel in self.files():
+            path = os.path.join(self.root, rel)
+            items.append({"path": rel.replace(os.sep, "/"), "size": os.path.getsize(path),
+                          "sha256": file_sha256(path)})
+        return {"key": self.key(), "driver": self.driver_name, "layout": self.layout(), "files": items}
+
+    def resolve_paths(self, paths) -> list:
+        """Оставляет из запрошенных путей (через '/') только входящие в архив"""
+        known = {rel.replace(os.sep, "/"): rel for rel in self.files()}
+        return [known[p] for p in dict.fromkeys(paths) if p in known]
+
+
+def _dos_datetime(mtime: float):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipStreamWriter:
+    """
+    Запись zip-архива в поток без перемотки. Заранее сжатые файлы пишутся
+    с CRC и размерами в локальном заголовке; крупные файлы сжимаются на лету,
+    и их CRC и размеры уходят в дескриптор данных после содержимого. Первый
+    байт уходит клиенту сразу, а память не зависит от размера архива.
+    """
+
+    def __init__(self, out, buffer_size: int = STREAM_CHUNK):
+        self._out = out
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self._offset = 0
+        self._entries = []
+
+    def _write(self, data):
+        self._offset += len(data)
+        if len(data) >= self._buffer_size:
+            # Крупный блок уходит напрямую, без копирования в буфер
+            self.flush()
+            self._out.write(data)
+            return
+        self._buffer += data
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._out.write(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _local_header(self, arcname: str, mtime: float, method: int, flags: int, crc=0, comp_size=0, size=0):
+        name = arcname.replace(os.sep, "/").encode("utf-8")
+        if not arcname.isascii():
+            flags |= 0x800  # имя в UTF-8
+        dos_time, dos_date = _dos_datetime(mtime)
+        header_offset = self._offset
+        if header_offset > ZIP32_LIMIT:
+            raise ValueError("Archive is too large for zip32")
+        self._write(struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, flags, method, dos_time, dos_date,
+                                crc, comp_size, size, len(name), 0) + name)
+        return [name, flags, method, dos_time, dos_date, crc, comp_size, size, header_offset]
+
+    def add_member(self, arcname: str, mtime: float, method: int, crc: int, size: int, data: bytes):
+        """Добавляет заранее сжатый файл (см. compress_member)"""
+        if size > ZIP32_LIMIT or len(data) > ZIP32_LIMIT:
+            raise ValueError(f"File is too large for zip32: {arcname}")
+        entry = self._local_header(arcname, mtime, method, 0, crc, len(data), size)
+        self._write(data)
+        self._entries.append(entry)
+
+    def add_file(self, path: str, arcname: str, method: int = zipfile.ZIP_DEFLATED, level: int = DEFLATE_LEVEL):
+        """Добавляет файл с диска, читая и сжимая его по частям"""
+        entry = self._local_header(arcname, os.path.getmtime(path), method, 0x08)
+
+        crc, size, comp_size = 0, 0, 0
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if method == zipfile.ZIP_DEFLATED else None
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                comp_size += len(chunk)
+                self._write(chunk)
+        if compressor:
+            tail = compressor.flush()
+            comp_size += len(tail)
+            self._write(tail)
+        if size > ZIP32_LIMIT or comp_size > ZIP32_LIMIT:
+            raise ValueError(f"File is too large for zip32: {arcname}")
+
+        self._write(struct.pack("<IIII", 0x08074B50, crc, comp_size, size))
+        entry[5:8] = crc, comp_size, size
+        self._entries.append(entry)
+
+    def close(self):
+        """Пишет центральный каталог и сбрасывает буфер"""
+        cd_offset = self._offset
+        for name, flags, method, dos_time, dos_date, crc, comp_size, size, header_offset in self._entries:
+            self._write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, flags, method, dos_time, dos_date,
+                                    crc, comp_size, size, len(name), 0, 0, 0, 0, 0, header_offset) + name)
+        cd_size = self._offset - cd_offset
+        if len(self._entries) > 0xFFFF or cd_offset > ZIP32_LIMIT:
+            raise ValueError("Archive is too large for zip32")
+        self._write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(self._entries), len(self._entries),
+                                cd_size, cd_offset, 0))
+        self.flush()
+
+
+def sample_ratio(path: str, size: int) -> float:
+    """Во сколько раз ужимаются образцы файла быстрым deflate (0..1)"""
+    with open(path, "rb") as f:
+        if size <= SAMPLE_SIZE * 3:
+            data = f.read()
+        else:
+            data = f.read(SAMPLE_SIZE)
+            f.seek(size // 2 - SAMPLE_SIZE // 2)
+            data += f.read(SAMPLE_SIZE)
+            f.seek(size - SAMPLE_SIZE)
+            data += f.read(SAMPLE_SIZE)
+    if not data:
+        return 1.0
+    return len(zlib.compress(data, FAST_DEFLATE_LEVEL)) / len(data)
+
+
+def choose_compression(path: str):
+    """Метод и уровень сжатия для файла: (ZIP_STORED | ZIP_DEFLATED, уровень)"""
+    st = os.stat(path)
+    memo_key = (path, st.st_size, st.st_mtime_ns)
+    with _method_lock:
+        if memo_key in _method_memo:
+            return _method_memo[memo_key]
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in STORED_EXTENSIONS:
+        choice = (zipfile.ZIP_STORED, 0)
+    elif ext in DEFLATE_EXTENSIONS or st.st_size <= SMALL_FILE:
+        choice = (zipfile.ZIP_DEFLATED, DEFLATE_LEVEL)
+    else:
+        ratio = sample_ratio(path, st.st_size)
+        if ratio >= STORE_RATIO:
+            choice = (zipfile.ZIP_STORED, 0)
+        elif ratio >= FAST_RATIO:
+            choice = (zipfile.ZIP_DEFLATED, FAST_DEFLATE_LEVEL)
+        else:
+            choice = (zipfile.ZIP_DEFLATED, DEFLATE_LEVEL)
+
+    with _method_lock:
+        _method_memo[memo_key] = choice
+    return choice
+
+
+def plan_entries(root: str, files, policy: str = COMPRESSION_POLICY) -> list:
+    """Список (путь, метод, уровень) для каждого файла архива"""
+    entries = []
+    for rel in files:
+        if policy == "deflate":
+            method, level = zipfile.ZIP_DEFLATED, DEFLATE_LEVEL
+        else:
+            method, level = choose_compression(os.path.join(root, rel))
+        entries.append((rel, method, level))
+    return entries
+
+
+def stored_zip_size(root: str, entries, prelude=()) -> int:
+    """Точный размер архива build_files_zip(), если все файлы сохранены без сжатия"""
+    total = 22  # конец центрального каталога
+    for arcname, _, data in prelude:
+        total += 30 + 46 + 2 * len(arcname.encode("utf-8")) + len(data)
+    for rel, method, level in entries:
+        name_len = len(rel.replace(os.sep, "/").encode("utf-8"))
+        size = os.path.getsize(os.path.join(root, rel))
+        total += 30 + name_len + size  # локальный заголовок и данные
+        if size > MEMBER_BUFFER_LIMIT:
+            total += 16  # дескриптор данных у файлов, сжимаемых на лету
+        total += 46 + name_len  # запись центрального каталога
+    return total
+
+
+def compress_member(path: str, method: int, level: int):
+    """Читает и сжимает файл целиком: (mtime, crc, исходный размер, данные)"""
+    mtime = os.path.getmtime(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    crc = zlib.crc32(data)
+    size = len(data)
+    if method == zipfile.ZIP_DEFLATED:
+        # zlib отпускает GIL, поэтому потоки сжимают файлы на разных ядрах
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        data = compressor.compress(data) + compressor.flush()
+    return mtime, crc, size, data
+
+
+def build_files_zip(out, root: str, entries, workers: int = BUNDLE_WORKERS, prelude=()):
+    """
+    Упаковывает файлы из root по плану plan_entries() в zip-архив, записываемый в out.
+    prelude - [(имя, mtime, данные)], записываются первыми без сжатия (манифест архива).
+    Файлы до MEMBER_BUFFER_LIMIT сжимаются пулом из workers потоков с упреждением
+    не больше 2 * workers файлов; порядок и содержимое архива от workers не зависят.
+    """
+    writer = ZipStreamWriter(out)
+    for arcname, mtime, data in prelude:
+        writer.add_member(arcname, mtime, zipfile.ZIP_STORED, zlib.crc32(data), len(data), data)
+
+    def write(entry, future):
+        rel, method, level = entry
+        path = os.path.join(root, rel)
+        if future is None:
+            writer.add_file(path, rel, method, level)
+            return
+        mtime, crc, size, data = future.result()
+        writer.add_member(rel, mtime, method, crc, size, data)
+
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        window = collections.deque()
+        for entry in entries:
+            path = os.path.join(root, entry[0])
+            if os.path.getsize(path) > MEMBER_BUFFER_LIMIT:
+                future = None
+            elif pool:
+                future = pool.submit(compress_member, path, entry[1], entry[2])
+            else:
+                future = _Done(compress_member(path, entry[1], entry[2]))
+            window.append((entry, future))
+            if len(window) >= max(workers, 1) * 2:
+                write(*window.popleft())
+        while window:
+            write(*window.popleft())
+    finally:
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+    writer.close()
+
+
+class _Done:
+    """Готовый результат с интерфейсом Future для последовательной сборки"""
+
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+
+def build_tree_zip(out, root: str):
+    """Упаковывает всё дерево root в zip-архив, записываемый в out"""
+    build_files_zip(out, root, plan_entries(root, tree_files(root)))
+
+
+class ChunkedWriter:
+    """Обёртка над сокетом для Transfer-Encoding: chunked"""
+
+    def __init__(self, out):
+        self._out = out
+
+    def write(self, data):
+        if data:
+            self._out.write(b"%X\r\n" % len(data) + data + b"\r\n")
+
+    def close(self):
+        self._out.write(b"0\r\n\r\n")
+
+
+class TeeWriter:
+    """
+    Пишет одни и те же данные в кэш и клиенту. Если клиент отключился,
+    сборка продолжается только в кэш - следующий запрос получит готовый архив.
+    """
+
+    def __init__(self, cache_file, client):
+        self._cache_file = cache_file
+        self._client = client
+        self.client_error = None
+
+    def write(self, data):
+        if self._cache_file is not None:
+            self._cache_file.write(data)
+        if self._client is not None:
+            try:
+                self._client.write(data)
+            except OSError as e:
+                self.client_error = e
+                self._client = None
+                if self._cache_file is None:
+                    raise
+
+
+class BundleCache:
+    """Кэш готовых архивов на диске с вытеснением давно не использованных"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}  # key -> [замок, сколько запросов его держат или ждут]
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".zip")
+
+    def lookup(self, key: str):
+        """Путь к готовому архиву или None, если его ещё нет"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # mtime служит отметкой последнего использования
+        except OSError:
+            return None
+        return path
+
+    @contextlib.contextmanager
+    def _key_lock(self, key: str):
+        """Замок сборки архива key; запись удаляется, когда он никому не нужен"""
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    @contextlib.contextmanager
+    def populate(self, key: str, wait: bool = True):
+        """
+        Файл для сборки архива key; после успешного выхода из блока он
+        становится записью кэша. Отдаёт None, если архив уже готов или
+        (при wait=False) его прямо сейчас собирает другой запрос.
+        """
+        with self._key_lock(key) as key_lock:
+            if not key_lock.acquire(blocking=wait):
+                yield None
+                return
+            try:
+                # Параллельный запрос мог собрать архив, пока мы ждали
+                if self.lookup(key):
+                    yield None
+                    return
+
+                os.makedirs(self.cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        yield f
+                    os.replace(tmp_path, self.path_for(key))
+                except BaseException:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+            finally:
+                key_lock.release()
+        self.evict(keep=self.path_for(key))
+
+    def get(self, key: str, build):
+        """Возвращает путь к архиву, собирая его через build(file) при промахе"""
+        path = self.lookup(key)
+        if path:
+            return path
+        with self.populate(key) as f:
+            if f is not None:
+                build(f)
+        return self.path_for(key)
+
+    def evict(self, keep: str = None):
+        """Удаляет самые старые архивы, пока кэш не уложится в лимит"""
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".zip"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class _CountingSink:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def compression_report(root: str, policies=("deflate", COMPRESSION_POLICY), workers: int = BUNDLE_WORKERS) -> list:
+    """Время CPU, время сборки и размер архива дерева root для каждой политики сжатия"""
+    files = tree_files(root)
+    raw = sum(os.path.getsize(os.path.join(root, rel)) for rel in files)
+    rows = []
+    for policy in policies:
+        with _method_lock:
+            _method_memo.clear()  # оценка файлов входит в замер
+        sink = _CountingSink()
+        started, wall_started = time.process_time(), time.perf_counter()
+        entries = plan_entries(root, files, policy)
+        build_files_zip(sink, root, entries, workers)
+        cpu, wall = time.process_time() - started, time.perf_counter() - wall_started
+        stored = sum(1 for e in entries if e[1] == zipfile.ZIP_STORED)
+        rows.append({"policy": policy, "files": len(files), "stored": stored,
+                     "raw": raw, "size": sink.size, "cpu": cpu, "wall": wall})
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Архивы драйверов")
+    parser.add_argument("--report", action="store_true", help="сравнить политики сжатия по деревьям производителей")
+    parser.add_argument("--workers", type=int, default=BUNDLE_WORKERS, help="потоков сжатия")
+    parser.add_argument("roots", nargs="*", help="папки для отчёта (по умолчанию - все в 'installer builder')")
+    args = parser.parse_args()
+
+    if args.report:
+        drivers_root = os.path.join(BASE_DIR, "installer builder")
+        roots = args.roots or [os.path.join(drivers_root, d) for d in sorted(os.listdir(drivers_root))]
+        for root in roots:
+            rows = compression_report(root, workers=args.workers)
+            base = rows[0]
+            print(f"{os.path.basename(root)}: {base['files']} files, {base['raw'] / 1e6:.1f} MB")
+            for row in rows:
+                saved = base["size"] - row["size"]
+                print(f"  {row['policy']:<12} {row['size'] / 1e6:8.2f} MB  cpu {row['cpu']:6.2f} s  wall {row['wall']:6.2f} s"
+                      f"  stored {row['stored']:4}  vs deflate: {saved / 1e6:+.2f} MB, "
+                      f"{base['cpu'] - row['cpu']:+.2f} s cpu")
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Общий канал событий для всех открытых вкладок (/api/events, Server-Sent Events).
+Источники состояния публикуют только изменения, подписчики ждут их на условной
+переменной; последние HISTORY событий хранятся, чтобы переподключившийся
+клиент (Last-Event-ID) получил пропущенное без полного снимка.
+"""
+
+import asyncio
+import collections
+import json
+import threading
+from contextlib import contextmanager
+
+HISTORY = 256  # событий в памяти для переподключений
+
+
+class EventHub:
+    def __init__(self, history=HISTORY):
+        self._cond = threading.Condition()
+        self._events = collections.deque(maxlen=history)  # (id, тип, JSON)
+        self.last_id = 0
+        self.subscribers = 0
+        self._waiters = []  # (цикл событий, asyncio.Event) подписчиков wait_async
+
+    def publish(self, kind, data):
+        with self._cond:
+            self.last_id += 1
+            self._events.append((self.last_id, kind, json.dumps(data, ensure_ascii=False)))
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # цикл событий уже остановлен
+
+    def since(self, last_id):
+        """События после last_id или None, если часть из них уже вытеснена из истории"""
+        with self._cond:
+            return self._since(last_id)
+
+    def _since(self, last_id):
+        if last_id > self.last_id:
+            return None  # id из прошлого запуска сервера
+        if last_id < self.last_id and (not self._events or self._events[0][0] > last_id + 1):
+            return None
+        return [e for e in self._events if e[0] > last_id]
+
+    def wait(self, last_id, timeout):
+        """Как since(), но ждёт событий не дольше timeout; [] - ничего не случилось"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.last_id != last_id, timeout)
+            return self._since(last_id)
+
+    async def wait_async(self, last_id, timeout):
+        """wait() для корутин: ждёт, не занимая поток"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._cond:
+            if self.last_id == last_id:
+                self._waiters.append(waiter)
+            else:
+                event.set()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return self.since(last_id)
+
+    @contextmanager
+    def subscribe(self):
+        with self._cond:
+            self.subscribers += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+def format_event(event_id, kind, payload):
+    """Событие в формате text/event-stream"""
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n".encode("utf-8")
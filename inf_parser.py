@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Разбор INF-файлов драйверов принтеров и вычисление набора файлов для модели
+"""
+
+import os
+
+# Ключи секции установки, значения которых - имена файлов
+FILE_KEYS = ("DataFile", "DriverFile", "ConfigFile", "HelpFile")
+# Ключи вида "Имя,файл.dll" (обычно через %строку%)
+NAMED_FILE_KEYS = ("LanguageMonitor", "PrintProcessor")
+
+
+def _split_fields(value: str) -> list:
+    """Делит значение по запятым с учётом кавычек"""
+    fields, cur, quoted = [], [], False
+    for ch in value:
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            fields.append("".join(cur).strip())
+            cur = []
+            continue
+        cur.append(ch)
+    fields.append("".join(cur).strip())
+    return [f.strip('"').strip() for f in fields]
+
+
+def _strip_comment(line: str) -> str:
+    quoted = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            quoted = not quoted
+        elif ch == ";" and not quoted:
+            return line[:i]
+    return line
+
+
+def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw.startswith(b"\xff\xfe") or raw.startswith(b"\xfe\xff"):
+        return raw.decode("utf-16")
+    if raw.startswith(b"\xef\xbb\xbf"):
+        return raw[3:].decode("utf-8", errors="replace")
+    return raw.decode("latin-1")
+
+
+class InfFile:
+    """Разобранный INF: секции, строки и поиск файлов для драйвера"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sections = {}  # ИМЯ СЕКЦИИ -> [(ключ или None, значение)]
+        self.strings = {}
+        self._parse(_read_text(path))
+
+    def _parse(self, text: str):
+        current = None
+        pending = ""
+        for raw in text.splitlines():
+            line = _strip_comment(raw).strip()
+            if line.endswith("\\"):
+                pending += line[:-1]
+                continue
+            line, pending = (pending + line).strip(), ""
+            if not line:
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                current = self.sections.setdefault(line[1:-1].strip().upper(), [])
+                continue
+            if current is None:
+                continue
+            key, value = None, line
+            if "=" in line:
+                k, v = line.split("=", 1)
+                key, value = k.strip().strip('"'), v.strip()
+            current.append((key, value))
+        for key, value in self.sections.get("STRINGS", []):
+            if key:
+                self.strings[key.upper()] = value.strip('"')
+
+    def expand(self, value: str) -> str:
+        """Подставляет %строки% из секции [Strings]"""
+        parts = value.split("%")
+        if len(parts) < 3:
+            return value
+        out = [parts[0]]
+        for i in range(1, len(parts), 2):
+            token = parts[i]
+            out.append(self.strings.get(token.upper(), f"%{token}%") if token else "%")
+            if i + 1 < len(parts):
+                out.append(parts[i + 1])
+        return "".join(out)
+
+    def entries(self, section: str) -> list:
+        return self.sections.get(section.upper(), [])
+
+    def values(self, section: str, key: str) -> list:
+        """Все значения ключа в секции"""
+        key = key.upper()
+        return [v for k, v in self.entries(section) if k and k.upper() == key]
+
+    def model_sections(self, arch: str = "NTamd64") -> list:
+        """Секции моделей из [Manufacturer], подходящие для архитектуры"""
+        result = []
+        for _, value in self.entries("Manufacturer"):
+            fields = _split_fields(value)
+            base, decorations = fields[0], fields[1:]
+            matched = [d for d in decorations if d.upper().startswith(arch.upper())]
+            # Более конкретные декорации (с версией ОС) Windows выбирает первыми
+            for deco in sorted(matched, key=len, reverse=True):
+                result.append(f"{base}.{deco}")
+            if not decorations or not matched:
+                result.append(base)
+        return result
+
+    def install_section(self, driver_name: str, arch: str = "NTamd64"):
+        """Имя секции установки для драйвера (например, 'Kyocera ECOSYS P3145dn KX')"""
+        wanted = driver_name.upper()
+        for section in self.model_sections(arch):
+            for key, value in self.entries(section):
+                if key and self.expand(key).upper() == wanted:
+                    name = _split_fields(value)[0]
+                    decorated = f"{name}.{arch}"
+                    return decorated if decorated.upper() in self.sections else name
+        return None
+
+    def _section_files(self, section: str) -> list:
+        files = []
+        for key, value in self.entries(section):
+            fields = _split_fields(value if key is None else f"{key}={value}")
+            # Строка секции файлов: destination[,source,...]
+            dest = fields[0]
+            source = fields[1] if len(fields) > 1 and fields[1] else dest
+            if source:
+                files.append(source)
+        return files
+
+    def install_files(self, section: str, _seen=None) -> set:
+        """Файлы, которые копирует секция установки (с учётом вложенных секций)"""
+        seen = _seen if _seen is not None else set()
+        if section.upper() in seen:
+            return set()
+        seen.add(section.upper())
+
+        files = set()
+        for key, value in self.entries(section):
+            if not key:
+                continue
+            k = key.upper()
+            if k == "COPYFILES":
+                for item in _split_fields(value):
+                    if item.startswith("@"):
+                        files.add(item[1:])
+                    elif item:
+                        files.update(self._section_files(item))
+            elif k in (f.upper() for f in FILE_KEYS):
+                files.add(self.expand(value).strip('"'))
+            elif k == "DEPENDENTFILES":
+                files.update(f for f in _split_fields(self.expand(value)) if f)
+            elif k in (f.upper() for f in NAMED_FILE_KEYS):
+                fields = _split_fields(self.expand(value).strip('"'))
+                if len(fields) > 1 and "." in fields[-1]:
+                    files.add(fields[-1])
+            elif k == "DATASECTION":
+                for sub in _split_fields(value):
+                    files |= self.install_files(sub, seen)
+            elif k == "COREDRIVERSECTIONS":
+                fields = _split_fields(value)
+                # Пары "{GUID},СЕКЦИЯ"
+                for sub in fields[1::2]:
+                    files |= self.install_files(sub, seen)
+        return files
+
+    def catalog_files(self) -> set:
+        files = set()
+        for key, value in self.entries("Version"):
+            if key and key.upper().startswith("CATALOGFILE"):
+                files.add(value.strip('"'))
+        return files
+
+    def source_media_files(self) -> set:
+        """Тег-файлы и cab-архивы носителей из [SourceDisksNames]"""
+        files = set()
+        for section in self.sections:
+            if section.startswith("SOURCEDISKSNAMES"):
+                for _, value in self.sections[section]:
+                    fields = _split_fields(self.expand(value))
+                    if len(fields) > 1 and fields[1]:
+                        files.add(fields[1])
+        return files
+
+
+def _compressed_name(name: str) -> str:
+    """Имя файла, сжатого compress.exe: последний символ расширения заменён на '_'"""
+    return name[:-1] + "_" if "." in name else name + "._"
+
+
+def driver_file_closure(inf_path: str, driver_name: str, arch: str = "NTamd64", missing=None) -> list:
+    """
+    Минимальный набор файлов для установки драйвера driver_name из inf_path.
+    Возвращает пути относительно папки INF; KeyError, если модели нет в INF.
+    В список missing (если передан) добавляются имена из INF, которых нет в папке.
+    """
+    inf = InfFile(inf_path)
+    section = inf.install_section(driver_name, arch)
+    if not section:
+        raise KeyError(f"Driver {driver_name} not found in {os.path.basename(inf_path)}")
+
+    wanted = inf.install_files(section) | inf.catalog_files() | inf.source_media_files()
+
+    # Индекс файлов папки INF по имени в верхнем регистре (ближайшие к корню - первыми)
+    inf_dir = os.path.dirname(inf_path)
+    index = {}
+    for dirpath, dirs, files in os.walk(inf_dir):
+        dirs.sort()
+        for name in sorted(files):
+            rel = os.path.relpath(os.path.join(dirpath, name), inf_dir)
+            index.setdefault(name.upper(), rel)
+
+    result = {os.path.relpath(inf_path, inf_dir)}
+    for name in wanted:
+        name = os.path.basename(name.replace("\\", "/"))
+        rel = index.get(name.upper()) or index.get(_compressed_name(name).upper())
+        if rel:
+            result.add(rel)
+        elif missing is not None:
+            missing.append(name)
+    if missing is not None:
+        missing.sort()
+    return sorted(result)
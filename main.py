@@ -1,13 +1,29 @@
 # -*- coding: utf-8 -*-
-import json, os, threading, socket, base64
+import json, os, threading, time, socket, base64
+import asyncio
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
 import re, hashlib, urllib.parse
+import ipaddress
+import io
+import zipfile
+import driver_bundles
+import netprobe
+import discovery
+import printer_registry
+import model_catalog
+import aioserver
+import event_hub
+import plugin_client
+import static_assets
 
 HOST = "0.0.0.0"
 PORT = 8080
+USE_SENDFILE = True  # большие файлы - через sendfile, минуя копирование в Python
+SERVER_ENGINE = "threading"  # "asyncio" - HTTP/1.1 с keep-alive и пулом потоков (aioserver)
 WEB_ROOT = os.path.join(os.path.dirname(__file__), "static")
 
+# Начальное содержимое реестра принтеров (записывается, только если база пуста)
 SAVED_PRINTERS = [
     {"ip": "192.168.0.190", "host": "KMCC36FF", "model": "ECOSYS P3145dn", "desc": "Экономисты", "can_scan": False},
     {"ip": "192.168.0.105", "host": "KMB68267", "model": "ECOSYS M2040dn",   "desc": "Бухгалтеры", "can_scan": True},
@@ -16,36 +32,304 @@ SAVED_PRINTERS = [
 ]
 
 GATE_PORTS = [9100, 631, 80]
+DISCOVERY_SUBNETS = []  # подсети для автопоиска принтеров, например ["192.168.0.0/24", "10.1.4.0/22"]
+DISCOVERY_INTERVAL = 6 * 3600  # сек между фоновыми обходами
+POLL_MIN_INTERVAL = 5  # сек, для принтеров, у которых только что сменилось состояние
+POLL_MAX_INTERVAL = 120  # сек, для стабильных
 PLUGIN_PORT = 8081  # порт для плагина
+PLUGIN_WATCH_INTERVAL = 5  # сек между проверками плагина, пока открыт хоть один /api/events
+JOB_WATCH_INTERVAL = 0.7  # сек между опросами идущих установок
+JOB_KEEP = 60  # сек, сколько завершённое задание остаётся в снимке для новых вкладок
+EVENTS_HEARTBEAT = 15  # сек; комментарий в потоке, чтобы заметить ушедшего клиента
+EVENTS_MAX_STREAMS = 200  # одновременных /api/events при SERVER_ENGINE="threading" (по потоку на каждый)
+DRIVERS_ROOT = os.path.join(os.path.dirname(__file__), "installer builder")
 
+BUNDLE_CACHE = driver_bundles.BundleCache()
+ASSETS = static_assets.AssetPipeline(WEB_ROOT)
+PLUGIN = plugin_client.PluginClient("127.0.0.1", PLUGIN_PORT)
+EVENTS = event_hub.EventHub()
 
-def tcp_open(ip: str, port: int, timeout: float = 0.25) -> bool:
-    try:
-        with socket.create_connection((ip, port), timeout=timeout):
-            return True
-    except Exception:
+
+def parse_range(header: str, size: int):
+    """
+    Разбор заголовка Range для одного диапазона байт.
+    (start, end) включительно; None - заголовок не поддерживается и файл
+    отдаётся целиком; False - диапазон за пределами файла.
+    """
+    m = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header or "")
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+        if m.group(2) and end < start:
+            return None
+    else:
+        length = int(m.group(2))
+        if length == 0:
+            return False
+        start, end = max(size - length, 0), size - 1
+    if start >= size:
         return False
+    return start, min(end, size - 1)
 
 def check_plugin_installed() -> bool:
-    """Проверяет, установлен ли плагин (слушает ли порт 8081)"""
-    try:
-        with socket.create_connection(("127.0.0.1", PLUGIN_PORT), timeout=0.5):
-            return True
-    except Exception:
-        return False
+    """Отвечает ли плагин на /health (результат кэшируется, соединение переиспользуется)"""
+    return PLUGIN.healthy()
+
+def plugin_request(path, data=None):
+    """(HTTP-статус, JSON) ответа плагина; data - тело POST-запроса"""
+    return PLUGIN.request(path, data)
+
+
+class StatusPoller:
+    """
+    Фоновый опрос доступности принтеров. Принтер, состояние которого не меняется,
+    опрашивается всё реже (до POLL_MAX_INTERVAL), только что изменившийся - снова часто.
+    """
+
+    def __init__(self, ips, on_change=None):
+        self.ips = ips  # функция -> список IP для опроса
+        self.on_change = on_change  # (ip, {"online", "checked"}) при смене состояния
+        self._cond = threading.Condition()
+        self._status = {}  # ip -> {"online", "checked", "interval", "due"}
+        self._round_started = 0.0
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-poller", daemon=True)
+                self._thread.start()
+
+    def status(self, ip):
+        with self._cond:
+            return dict(self._status.get(ip, {}))
+
+    def snapshot(self):
+        """ip -> {"online", "checked"} для проверенных принтеров"""
+        with self._cond:
+            return {ip: {"online": st["online"], "checked": st["checked"]}
+                    for ip, st in self._status.items() if st["checked"] is not None}
+
+    def refresh(self, timeout=None):
+        """Немедленный опрос всех принтеров; ждёт окончания раунда, начатого после вызова"""
+        self.start()
+        with self._cond:
+            requested = time.time()
+            for st in self._status.values():
+                st["due"] = 0.0
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._round_started >= requested, timeout)
+
+    def wait_checked(self, ips, timeout=None):
+        """Ждёт первой проверки принтеров, которых ещё нет в таблице (например, только что добавленных)"""
+        self.start()
+        with self._cond:
+            self._cond.notify_all()  # новые адреса попадут в раунд сразу, а не после паузы
+            return self._cond.wait_for(
+                lambda: all(self._status.get(ip, {}).get("checked") is not None for ip in ips), timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.time()
+                ips = list(dict.fromkeys(ip for ip in self.ips() if ip))
+                for ip in ips:
+                    self._status.setdefault(ip, {"online": None, "checked": None,
+                                                 "interval": POLL_MIN_INTERVAL, "due": 0.0})
+                due = [ip for ip in ips if self._status[ip]["due"] <= now]
+                if not due:
+                    next_due = min((self._status[ip]["due"] for ip in ips), default=now + POLL_MAX_INTERVAL)
+                    self._cond.wait(min(next_due - now, POLL_MAX_INTERVAL))
+                    continue
+                started = now
+
+            online = netprobe.probe(due, ports=GATE_PORTS)
+
+            changed = []
+            with self._cond:
+                checked = time.time()
+                for ip in due:
+                    if ip not in online:
+                        continue  # не успели проверить до SCAN_DEADLINE - в следующем раунде
+                    st = self._status[ip]
+                    state = online[ip]
+                    if st["online"] is None or st["online"] != state:
+                        st["interval"] = POLL_MIN_INTERVAL
+                        changed.append(ip)
+                    else:
+                        st["interval"] = min(st["interval"] * 2, POLL_MAX_INTERVAL)
+                    st.update(online=state, checked=checked, due=checked + st["interval"])
+                self._round_started = max(self._round_started, started)
+                self._cond.notify_all()
+            if self.on_change:
+                for ip in changed:
+                    self.on_change(ip, {"online": online[ip], "checked": checked})
+
+
+REGISTRY = printer_registry.PrinterRegistry(seed=SAVED_PRINTERS)
+
+
+def merge_discovered(devices):
+    """Добавляет в реестр найденные устройства с моделью из каталога; возвращает добавленные"""
+    added = []
+    for d in devices:
+        # Модель без драйвера в каталоге установить нельзя - такой принтер в реестре не нужен
+        if not d.get("model") or not model_catalog.resolve(d["model"]):
+            continue
+        printer = {"ip": d["ip"], "host": d.get("host", ""), "model": d["model"],
+                   "desc": "Найден автоматически", "can_scan": False}
+        if REGISTRY.add(printer, source="discovery"):
+            print(f"Discovered {printer['model']} at {printer['ip']}")
+            added.append(printer)
+    return added
+
+
+def discovery_loop():
+    while True:
+        try:
+            merge_discovered(discovery.discover(DISCOVERY_SUBNETS, ports=tuple(GATE_PORTS)))
+        except Exception as e:
+            print(f"Discovery failed: {e}")
+        time.sleep(DISCOVERY_INTERVAL)
 
-def scan_saved():
-    out = [dict(p) for p in SAVED_PRINTERS]
-    threads = []
-    def worker(i, ip):
-        ok = any(tcp_open(ip, p) for p in GATE_PORTS)
-        out[i]["online"] = bool(ok)
-    for i, p in enumerate(out):
-        t = threading.Thread(target=worker, args=(i, p.get("ip","")), daemon=True)
-        t.start(); threads.append(t)
-    for t in threads: t.join(timeout=1.2)
-    for p in out: p.setdefault("online", False)
-    return out
+
+POLLER = StatusPoller(REGISTRY.ips, on_change=lambda ip, st: EVENTS.publish("printer", dict(st, ip=ip)))
+
+
+class PluginWatcher:
+    """
+    Один общий опрос плагина для всех вкладок: доступность и ход установок,
+    запущенных через /api/install. Изменения уходят в EVENTS; пока нет ни одного
+    подписчика /api/events, плагин не опрашивается.
+    """
+
+    def __init__(self, client, hub):
+        self.client = client
+        self.hub = hub
+        self.installed = None
+        self._jobs = {}  # id -> (задание, когда завершилось или None)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="plugin-watcher", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def track(self, job):
+        """Следить за заданием, которое плагин только что поставил в очередь"""
+        self._update_job(job)
+        self.start()
+
+    def snapshot(self):
+        with self._lock:
+            jobs = [job for job, _ in self._jobs.values()]
+        installed = self.installed if self.installed is not None else self.client.healthy()
+        return {"installed": installed, "jobs": jobs}
+
+    def _update_job(self, job):
+        done = time.time() if job.get("state") in ("succeeded", "failed") else None
+        with self._lock:
+            previous = self._jobs.get(job["id"])
+            self._jobs[job["id"]] = (job, done)
+        if not previous or previous[0] != job:
+            self.hub.publish("job", job)
+
+    def _check_jobs(self):
+        now = time.time()
+        with self._lock:
+            for job_id, (job, done) in list(self._jobs.items()):
+                if done and now - done > JOB_KEEP:
+                    del self._jobs[job_id]
+            active = [job_id for job_id, (job, done) in self._jobs.items() if not done]
+        for job_id in active:
+            try:
+                status, job = self.client.request(f"/jobs/{urllib.parse.quote(job_id)}")
+            except plugin_client.PluginUnavailable:
+                return
+            if status == 200:
+                self._update_job(job)
+            elif status == 404:  # плагин перезапущен, задания больше нет
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+
+    def _run(self):
+        next_health = 0.0
+        while True:
+            with self._lock:
+                busy = any(done is None for _, done in self._jobs.values())
+            self._wake.wait(JOB_WATCH_INTERVAL if busy else PLUGIN_WATCH_INTERVAL)
+            self._wake.clear()
+            if not self.hub.subscribers:
+                continue
+            if time.monotonic() >= next_health:
+                installed = self.client.healthy()
+                if installed != self.installed:
+                    self.installed = installed
+                    self.hub.publish("plugin", {"installed": installed})
+                next_health = time.monotonic() + PLUGIN_WATCH_INTERVAL
+            if busy:
+                self._check_jobs()
+
+
+WATCHER = PluginWatcher(PLUGIN, EVENTS)
+
+
+def scan_saved(refresh=False, filters=None, limit=None, offset=0):
+    """
+    Принтеры из реестра с состоянием из таблицы фонового опроса: (записи, всего).
+    refresh - опросить заново.
+    """
+    POLLER.start()
+    out, total = REGISTRY.query(filters, limit, offset)
+    if refresh:
+        POLLER.refresh(timeout=netprobe.SCAN_DEADLINE + 1)
+    else:
+        POLLER.wait_checked([p["ip"] for p in out], timeout=netprobe.SCAN_DEADLINE + 1)
+    for p in out:
+        st = POLLER.status(p["ip"])
+        p["online"] = bool(st.get("online"))
+        p["checked"] = st.get("checked")
+    return out, total
+
+def live_snapshot():
+    """Полное состояние для нового подписчика /api/events"""
+    plugin = WATCHER.snapshot()
+    return {"now": time.time(), "printers": POLLER.snapshot(),
+            "plugin": {"installed": plugin["installed"]}, "jobs": plugin["jobs"]}
+
+def render_events(events, last_id):
+    """
+    (данные для потока /api/events, id последнего отправленного события).
+    events=None - новый клиент или пропущено больше, чем хранится в истории: полный снимок.
+    """
+    if events is None:
+        last_id = EVENTS.last_id
+        snapshot = json.dumps(live_snapshot(), ensure_ascii=False)
+        return event_hub.format_event(last_id, "snapshot", snapshot), last_id
+    if events:
+        return b"".join(event_hub.format_event(*event) for event in events), events[-1][0]
+    return b": ping\n\n", last_id
+
+async def stream_events_async(send, last_id):
+    """Поток /api/events в цикле событий aioserver"""
+    loop = asyncio.get_running_loop()
+    with EVENTS.subscribe():
+        events = EVENTS.since(last_id) if last_id is not None else None
+        await send(b"retry: 3000\n\n")
+        while True:
+            if events is None:
+                # Снимок может ждать ответа плагина - не в цикле событий
+                chunk, last_id = await loop.run_in_executor(None, render_events, None, last_id)
+            else:
+                chunk, last_id = render_events(events, last_id)
+            await send(chunk)
+            events = await EVENTS.wait_async(last_id, EVENTS_HEARTBEAT)
 
 class Handler(SimpleHTTPRequestHandler):
     def translate_path(self, path):
@@ -66,12 +350,215 @@ class Handler(SimpleHTTPRequestHandler):
         return path
 
     def end_headers(self):
-        if self.path.startswith("/api/"):
+        cache_control = self.__dict__.pop("cache_control", None)  # задаёт send_asset
+        if cache_control:
+            self.send_header("Cache-Control", cache_control)
+        elif self.path.startswith("/api/"):
             self.send_header("Cache-Control", "no-store")
         else:
             self.send_header("Cache-Control", "public, max-age=60")
         return super().end_headers()
 
+    def send_asset(self, asset, cache_control):
+        """Статический файл из памяти: 304 по If-None-Match, сжатый вариант по Accept-Encoding"""
+        encoding, body, etag = asset.variant(self.headers.get("Accept-Encoding"))
+        self.cache_control = cache_control
+        if asset.matches(self.headers.get("If-None-Match", "")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", asset.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, path, content_type, filename, etag):
+        """Отдача файла с поддержкой If-None-Match, Range и If-Range"""
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        size = os.path.getsize(path)
+        byte_range = None
+        if_range = self.headers.get("If-Range")
+        # If-Range с устаревшим ETag означает, что файл изменился - отдаём его целиком
+        if "Range" in self.headers and (if_range is None or if_range == etag):
+            byte_range = parse_range(self.headers["Range"], size)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        disp = f"attachment; filename={filename}; filename*=UTF-8''{urllib.parse.quote(filename)}"
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Disposition", disp)
+        self.send_header("Content-Length", str(end - start + 1))
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        with open(path, "rb") as f:
+            self.send_file_range(f, start, end - start + 1)
+
+    def send_file_range(self, f, offset, count):
+        """
+        count байт файла f с offset - через sendfile, без копирования данных
+        через Python; если sendfile недоступен - циклом чтения и записи
+        """
+        self.wfile.flush()
+        if USE_SENDFILE:
+            sendfile = getattr(self.wfile, "sendfile", None)  # фронтенд aioserver
+            if sendfile:
+                sendfile(f, offset, count)
+                return
+            # socket.sendfile сам откатывается на send(), если os.sendfile нет (Windows)
+            if isinstance(self.connection, socket.socket) and self.connection.gettimeout() != 0:
+                self.connection.sendfile(f, offset, count)
+                return
+        f.seek(offset)
+        remaining = count
+        while remaining > 0:
+            chunk = f.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+    def copyfile(self, source, outputfile):
+        # Статические файлы SimpleHTTPRequestHandler - тоже через sendfile
+        try:
+            offset = source.tell()
+            size = os.fstat(source.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return super().copyfile(source, outputfile)
+        if outputfile is not self.wfile:
+            return super().copyfile(source, outputfile)
+        self.send_file_range(source, offset, size - offset)
+
+    def send_text(self, status, message):
+        payload = message.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream_events(self):
+        """
+        Server-Sent Events: снимок состояния, затем только изменения из EVENTS.
+        Под asyncio поток событий обслуживает цикл событий, а не поток пула.
+        """
+        async_engine = isinstance(self.server, aioserver.AsyncHTTPServer)
+        # Под asyncio потоки открыты без ограничения числа потоков (есть aioserver.MAX_CONNECTIONS)
+        if not async_engine and EVENTS.subscribers >= EVENTS_MAX_STREAMS:
+            self.send_json({"error": "Too many event streams"}, 503)
+            return
+        POLLER.start()
+        WATCHER.start()
+        try:
+            last_id = int(self.headers.get("Last-Event-ID", ""))
+        except ValueError:
+            last_id = None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.end_headers()
+        self.close_connection = True
+        if async_engine:
+            self.async_stream = lambda send: stream_events_async(send, last_id)
+            return
+        with EVENTS.subscribe():
+            events = EVENTS.since(last_id) if last_id is not None else None
+            try:
+                self.wfile.write(b"retry: 3000\n\n")
+                while True:
+                    chunk, last_id = render_events(events, last_id)
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                    events = EVENTS.wait(last_id, EVENTS_HEARTBEAT)
+            except OSError:
+                pass  # вкладку закрыли
+
+    def driver_recipe(self, q):
+        """Состав архива драйверов по параметрам model и variant; при ошибке отправляет ответ и отдаёт None"""
+        model = (q.get('model') or [''])[0]
+        if not model:
+            self.send_text(400, "Model parameter required")
+            return None
+
+        info = model_catalog.resolve(model)
+        if not info:
+            self.send_text(404, f"Drivers for model {model} not found")
+            return None
+
+        drivers_path = os.path.join(DRIVERS_ROOT, info.tree)
+        if not os.path.exists(drivers_path):
+            self.send_text(404, f"Drivers not found at {drivers_path}")
+            return None
+
+        # В архив попадают только файлы, на которые ссылается INF для этой модели
+        variant = (q.get('variant') or ['all'])[0]
+        return driver_bundles.BundleRecipe(drivers_path, info.inf_relpath, info.driver, info.extra_dirs(variant),
+                                           info.twain_msi, info.quick_scan)
+
+    def stream_zip(self, root, entries, filename, etag=None, cache_key=None, prelude=()):
+        """
+        Отдаёт zip-архив по мере сборки. С cache_key архив параллельно
+        записывается в кэш, если его не собирает другой запрос.
+        """
+        stored = all(method == zipfile.ZIP_STORED for _, method, _ in entries)
+        chunked = not stored and self.request_version == "HTTP/1.1"
+        if chunked:
+            self.protocol_version = "HTTP/1.1"  # chunked допустим только в ответе HTTP/1.1
+        self.close_connection = True
+
+        disp = f"attachment; filename={filename}; filename*=UTF-8''{urllib.parse.quote(filename)}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Disposition", disp)
+        if etag:
+            self.send_header("ETag", etag)
+        if stored:
+            self.send_header("Content-Length", str(driver_bundles.stored_zip_size(root, entries, prelude)))
+        elif chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        client = driver_bundles.ChunkedWriter(self.wfile) if chunked else self.wfile
+        if cache_key:
+            # Если архив уже собирает другой запрос, не ждём его, а собираем свой поток без записи в кэш
+            with BUNDLE_CACHE.populate(cache_key, wait=False) as cache_file:
+                tee = driver_bundles.TeeWriter(cache_file, client)
+                driver_bundles.build_files_zip(tee, root, entries, prelude=prelude)
+        else:
+            tee = driver_bundles.TeeWriter(None, client)
+            driver_bundles.build_files_zip(tee, root, entries, prelude=prelude)
+        if chunked and tee.client_error is None:
+            client.close()
+
     def do_GET(self):
         parsed = urlparse(self.path)
         
@@ -86,17 +573,42 @@ class Handler(SimpleHTTPRequestHandler):
             self.wfile.write(payload)
             return
             
+        # Принтеры из реестра: фильтры ip/host/model/desc/can_scan, страницы limit/offset
         if parsed.path == "/api/scan":
-            items = scan_saved()
-            payload = json.dumps({"items": items}, ensure_ascii=False).encode("utf-8")
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json; charset=utf-8")
-            self.send_header("Content-Length", str(len(payload)))
-            self.end_headers()
-            self.wfile.write(payload)
+            q = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            refresh = q.pop("refresh", "0") not in ("", "0")
+            try:
+                limit = int(q.pop("limit")) if "limit" in q else None
+                offset = int(q.pop("offset", 0))
+                if "can_scan" in q:
+                    q["can_scan"] = q["can_scan"].lower() in ("1", "true", "yes")
+                items, total = scan_saved(refresh, q, limit, offset)
+            except ValueError as e:
+                self.send_text(400, f"Invalid query: {e}")
+                return
+            self.send_json({"items": items, "total": total, "now": time.time()})
             return
 
 
+        # Живые обновления для всех вкладок: принтеры, плагин, ход установок
+        if parsed.path == "/api/events":
+            self.stream_events()
+            return
+
+        # Ход установки: задание из очереди плагина
+        if parsed.path.startswith("/api/install/jobs/"):
+            job_id = parsed.path[len("/api/install/jobs/"):]
+            try:
+                status, result = plugin_request(f"/jobs/{urllib.parse.quote(job_id)}")
+            except plugin_client.PluginUnavailable as e:
+                self.send_json({"error": str(e)}, 503)
+                return
+            except Exception as e:
+                self.send_json({"error": str(e)}, 502)
+                return
+            self.send_json(result, status)
+            return
+
         # Скачивание плагина
         if parsed.path == "/dl/plugin":
             plugin_path = os.path.join(os.path.dirname(__file__), "static", "publish", "PrinterPlugin.exe")
@@ -106,86 +618,69 @@ class Handler(SimpleHTTPRequestHandler):
                 self.wfile.write(b"Plugin not found")
                 return
                 
-            filename = "PrinterPlugin.exe"
-            disp = f"attachment; filename={filename}; filename*=UTF-8''{urllib.parse.quote(filename)}"
+            st = os.stat(plugin_path)
+            etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+            self.send_file(plugin_path, "application/octet-stream", "PrinterPlugin.exe", etag)
+            return
+
+        # Манифест архива драйверов для синхронизации по изменениям
+        if parsed.path == "/api/drivers/manifest":
+            recipe = self.driver_recipe(parse_qs(parsed.query))
+            if not recipe:
+                return
+            manifest = recipe.manifest()
+            etag = f'"{manifest["key"]}"'
+            if etag in self.headers.get("If-None-Match", ""):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            payload = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
             self.send_response(200)
-            self.send_header("Content-Type", "application/octet-stream")
-            self.send_header("Content-Disposition", disp)
-            self.send_header("Content-Length", str(os.path.getsize(plugin_path)))
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("ETag", etag)
             self.end_headers()
-            
-            with open(plugin_path, "rb") as f:
-                while True:
-                    chunk = f.read(64 * 1024)
-                    if not chunk:
-                        break
-                    self.wfile.write(chunk)
+            self.wfile.write(payload)
             return
 
         # Скачивание драйверов
         if parsed.path == "/dl/drivers":
-            from urllib.parse import parse_qs
             q = parse_qs(parsed.query)
-            model = (q.get('model') or [''])[0]
-            
-            if not model:
-                self.send_response(400)
-                self.end_headers()
-                self.wfile.write(b"Model parameter required")
-                return
-            
-            # Определяем путь к драйверам в зависимости от модели
-            drivers_path = None
-            if "ECOSYS" in model.upper() or "P3145" in model.upper() or "M2040" in model.upper():
-                # Kyocera драйверы
-                drivers_path = os.path.join(os.path.dirname(__file__), "installer builder", "Kyocera")
-            elif "LBP223" in model.upper() or "MF428" in model.upper():
-                # Canon драйверы
-                drivers_path = os.path.join(os.path.dirname(__file__), "installer builder", "Canon")
-            else:
-                self.send_response(404)
-                self.end_headers()
-                self.wfile.write(f"Drivers for model {model} not found".encode('utf-8'))
+            recipe = self.driver_recipe(q)
+            if not recipe:
                 return
-            
-            if not os.path.exists(drivers_path):
-                self.send_response(404)
+            model = q['model'][0]
+
+            # Архив собирается один раз на версию дерева и дальше отдаётся из кэша
+            key = recipe.key()
+            etag = f'"{key}"'
+            if etag in self.headers.get("If-None-Match", ""):
+                self.send_response(304)
+                self.send_header("ETag", etag)
                 self.end_headers()
-                self.wfile.write(f"Drivers not found at {drivers_path}".encode('utf-8'))
                 return
-            
-            # Создаем архив с драйверами
-            import zipfile
-            import tempfile
-            
-            temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-            temp_zip.close()
-            
-            with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(drivers_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, drivers_path)
-                        zipf.write(file_path, arcname)
-            
+
             filename = f"{model}_drivers.zip"
-            disp = f"attachment; filename={filename}; filename*=UTF-8''{urllib.parse.quote(filename)}"
-            
-            self.send_response(200)
-            self.send_header("Content-Type", "application/zip")
-            self.send_header("Content-Disposition", disp)
-            self.send_header("Content-Length", str(os.path.getsize(temp_zip.name)))
-            self.end_headers()
-            
-            with open(temp_zip.name, "rb") as f:
-                while True:
-                    chunk = f.read(64 * 1024)
-                    if not chunk:
-                        break
-                    self.wfile.write(chunk)
-            
-            # Удаляем временный файл
-            os.unlink(temp_zip.name)
+            bundle_path = BUNDLE_CACHE.lookup(key)
+            if not bundle_path and "Range" in self.headers:
+                # Докачка возможна только из готового архива - собираем его целиком
+                entries = recipe.entries()
+                prelude = recipe.prelude()
+                bundle_path = BUNDLE_CACHE.get(
+                    key, lambda out: driver_bundles.build_files_zip(out, recipe.root, entries, prelude=prelude))
+            if bundle_path:
+                self.send_file(bundle_path, "application/zip", filename, etag)
+                return
+
+            # Промах кэша: архив уходит клиенту по мере сборки и параллельно пишется в кэш
+            self.stream_zip(recipe.root, recipe.entries(), filename, etag, cache_key=key, prelude=recipe.prelude())
+            return
+
+        # Статика из памяти; с диска отдаются только файлы, которых там нет (крупные)
+        asset = ASSETS.get(parsed.path)
+        if asset:
+            self.send_asset(*asset)
             return
 
         return super().do_GET()
@@ -193,8 +688,8 @@ class Handler(SimpleHTTPRequestHandler):
     def do_POST(self):
         parsed = urlparse(self.path)
         
-        # Автоматическая установка через плагин
-        if parsed.path == "/api/install":
+        # Автоматическая установка через плагин (/api/install/batch - нескольких принтеров сразу)
+        if parsed.path in ("/api/install", "/api/install/batch"):
             try:
                 content_length = int(self.headers.get('Content-Length', 0))
                 post_data = self.rfile.read(content_length)
@@ -209,25 +704,15 @@ class Handler(SimpleHTTPRequestHandler):
                     self.wfile.write(json.dumps({"error": "Plugin not installed"}, ensure_ascii=False).encode("utf-8"))
                     return
                 
-                # Отправляем запрос плагину
-                import urllib.request
-                import urllib.parse
-                
-                plugin_url = f"http://127.0.0.1:{PLUGIN_PORT}/install"
-                req_data = json.dumps(data).encode('utf-8')
-                
-                req = urllib.request.Request(plugin_url, data=req_data, headers={'Content-Type': 'application/json'})
-                # Увеличиваем таймаут до 2 минут для установки
-                with urllib.request.urlopen(req, timeout=120) as response:
-                    result = response.read().decode('utf-8')
-                
-                # Парсим ответ плагина
-                plugin_result = json.loads(result)
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json; charset=utf-8")
-                self.end_headers()
-                self.wfile.write(result.encode("utf-8"))
+                # Плагин ставит установку в очередь и сразу отвечает 202 с заданием
+                try:
+                    status, result = plugin_request(parsed.path[len("/api"):], data)
+                except plugin_client.PluginUnavailable as e:
+                    self.send_json({"error": str(e)}, 503)
+                    return
+                if status == 202 and isinstance(result.get("job"), dict):
+                    WATCHER.track(result["job"])
+                self.send_json(result, status)
                 return
                 
             except Exception as e:
@@ -238,10 +723,88 @@ class Handler(SimpleHTTPRequestHandler):
                 self.wfile.write(error_msg.encode("utf-8"))
                 return
         
+        # Поиск принтеров в подсетях (по умолчанию - DISCOVERY_SUBNETS)
+        if parsed.path == "/api/discover":
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(content_length).decode('utf-8')) if content_length else {}
+                subnets = [str(n) for n in data.get("subnets") or DISCOVERY_SUBNETS]
+                devices = discovery.discover(subnets, ports=tuple(GATE_PORTS))
+            except (ValueError, AttributeError, TypeError) as e:
+                self.send_text(400, f"Invalid request: {e}")
+                return
+            self.send_json({"found": devices, "added": merge_discovered(devices)})
+            return
+
+        # Добавление или изменение принтера в реестре
+        if parsed.path == "/api/printers":
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+                ip = str(data["ip"]).strip()
+            except (ValueError, KeyError, TypeError):
+                self.send_text(400, "Invalid JSON body: ip required")
+                return
+            # Адрес уходит в фоновый опрос и в подключения - только настоящий IP
+            try:
+                ip = str(ipaddress.ip_address(ip))
+            except ValueError as e:
+                self.send_text(400, f"Invalid ip: {e}")
+                return
+            fields = {k: data[k] for k in printer_registry.FIELDS if k in data}
+            try:
+                printer_registry.check_fields(fields)
+            except ValueError as e:
+                self.send_text(400, f"Invalid printer: {e}")
+                return
+            created = REGISTRY.add(dict(fields, ip=ip))
+            if not created:
+                REGISTRY.update(ip, fields)
+            self.send_json(REGISTRY.get(ip), 201 if created else 200)
+            return
+
+        # Архив только с изменившимися файлами драйверов (по путям из манифеста)
+        if parsed.path == "/dl/drivers/delta":
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+                q = {"model": [str(data.get("model", ""))], "variant": [str(data.get("variant", "all"))]}
+                paths = [str(p) for p in data.get("paths", [])]
+            except (ValueError, AttributeError, TypeError):
+                self.send_text(400, "Invalid JSON body")
+                return
+            recipe = self.driver_recipe(q)
+            if not recipe:
+                return
+            files = recipe.resolve_paths(paths)
+            self.stream_zip(recipe.root, recipe.entries(files), f"{q['model'][0]}_delta.zip", prelude=recipe.prelude())
+            return
+
         return super().do_POST()
 
+    def do_DELETE(self):
+        parsed = urlparse(self.path)
+
+        # Удаление принтера из реестра
+        if parsed.path == "/api/printers":
+            ip = parse_qs(parsed.query).get("ip", [""])[0]
+            if not REGISTRY.delete(ip):
+                self.send_text(404, f"Printer {ip} not found")
+                return
+            self.send_json({"deleted": ip})
+            return
+
+        self.send_error(405)
+
 if __name__ == "__main__":
     os.chdir(os.path.dirname(__file__))
-    httpd = ThreadingHTTPServer((HOST, PORT), Handler)
+    if SERVER_ENGINE == "asyncio":
+        httpd = aioserver.AsyncHTTPServer((HOST, PORT), Handler)
+    else:
+        httpd = ThreadingHTTPServer((HOST, PORT), Handler)
+    ASSETS.load()
+    POLLER.start()
+    if DISCOVERY_SUBNETS:
+        threading.Thread(target=discovery_loop, name="discovery", daemon=True).start()
     print(f"★ Web UI: http://127.0.0.1:{PORT}")
     httpd.serve_forever()
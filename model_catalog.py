@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Каталог моделей принтеров: папка драйверов производителя, INF, имя драйвера,
+варианты установки и пакет сканера. Описание хранится в static/files-db.json.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+
+VARIANTS = ("printer", "scanner", "all")
+MEMO_LIMIT = 4096  # запомненных результатов поиска по произвольным названиям
+
+
+def _default_path():
+    # В собранном PyInstaller плагине файл лежит рядом с распакованными модулями
+    base = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+    for path in (os.path.join(base, "static", "files-db.json"), os.path.join(base, "files-db.json")):
+        if os.path.exists(path):
+            return path
+    return os.path.join(base, "static", "files-db.json")
+
+
+CATALOG_PATH = _default_path()
+
+
+def _norm(name: str) -> str:
+    return re.sub(r"[\s_-]+", "", name).upper()
+
+
+class ModelInfo:
+    """Описание модели из каталога"""
+
+    def __init__(self, name: str, entry: dict):
+        self.name = name
+        self.vendor = entry["vendor"]
+        self.tree = entry.get("tree", self.vendor)  # папка в "installer builder"
+        self.inf = entry["inf"]  # путь к INF внутри папки производителя, через '/'
+        self.driver = entry["driver"]
+        self.variants = tuple(v for v in VARIANTS if v in entry)
+        self.scanner_dirs = tuple(entry.get("scanner_dirs", ()))
+        self.twain_msi = entry.get("twain_msi", "")
+        self.quick_scan = entry.get("quick_scan", "")  # папка Quick Scan внутри папки производителя
+        self.remove_queues = tuple(entry.get("remove_queues", ()))
+        self.aliases = tuple(entry.get("aliases", ()))
+        self.family = "{model}" in self.driver  # шаблон для всей серии
+
+    @property
+    def inf_relpath(self) -> str:
+        return os.path.join(*self.inf.split("/"))
+
+    def for_model(self, model: str) -> "ModelInfo":
+        """Запись серии, подставленная для конкретной модели"""
+        if not self.family:
+            return self
+        info = object.__new__(ModelInfo)
+        info.__dict__.update(self.__dict__)
+        info.name = model
+        info.driver = self.driver.format(model=model)
+        return info
+
+    def extra_dirs(self, variant: str) -> tuple:
+        """Папки сверх INF, нужные для варианта установки"""
+        return self.scanner_dirs if variant in ("scanner", "all") else ()
+
+
+class ModelCatalog:
+    """
+    Индекс моделей: точные имена - в словаре, алиасы - предкомпилированные
+    шаблоны (конкретные модели раньше серий). Результаты поиска запоминаются.
+    """
+
+    def __init__(self, data: dict):
+        self.models = {}
+        self._index = {}
+        self._patterns = []
+        for name, entry in data.items():
+            if not isinstance(entry, dict) or "driver" not in entry:
+                continue  # записи только для скачивания файлов
+            info = ModelInfo(name, entry)
+            self.models[name] = info
+            self._index[_norm(name)] = info
+            for alias in info.aliases:
+                self._patterns.append((re.compile(alias, re.IGNORECASE), info))
+        # Конкретные модели проверяются раньше серий
+        self._patterns.sort(key=lambda p: p[1].family)
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=CATALOG_PATH) -> "ModelCatalog":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def resolve(self, model: str):
+        """ModelInfo для названия модели (как в реестре или от пользователя) или None"""
+        key = _norm(model or "")
+        info = self._memo.get(key)
+        if info is not None or key in self._memo:
+            return info
+        info = self._index.get(key)
+        if info is None:
+            for pattern, candidate in self._patterns:
+                if pattern.search(model):
+                    info = candidate.for_model(model)
+                    break
+        with self._lock:
+            if len(self._memo) >= MEMO_LIMIT:
+                self._memo.clear()
+            self._memo[key] = info
+        return info
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> ModelCatalog:
+    """Каталог из CATALOG_PATH, загружается один раз"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = ModelCatalog.load()
+    return _catalog
+
+
+def set_catalog(catalog: ModelCatalog):
+    global _catalog
+    _catalog = catalog
+
+
+def resolve(model: str):
+    return get_catalog().resolve(model)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Неблокирующая проверка доступности принтеров по TCP-портам (asyncio)
+"""
+
+import asyncio
+
+PROBE_PORTS = (9100, 631, 80)
+CONNECT_TIMEOUT = 0.25  # на одно подключение
+SCAN_DEADLINE = 1.2  # на весь опрос
+MAX_INFLIGHT = 64  # одновременных подключений
+
+
+async def _connect(ip: str, port: int, timeout: float, slots: asyncio.Semaphore) -> bool:
+    async with slots:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, UnicodeError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+
+async def probe_host(ip: str, ports, timeout: float, slots: asyncio.Semaphore) -> bool:
+    """Подключается ко всем портам сразу; первый успешный отменяет остальные"""
+    if not ip:
+        return False
+    pending = {asyncio.ensure_future(_connect(ip, port, timeout, slots)) for port in ports}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(t.result() for t in done):
+                return True
+        return False
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+async def probe_all(ips, ports=PROBE_PORTS, timeout=CONNECT_TIMEOUT,
+                    deadline=SCAN_DEADLINE, max_inflight=MAX_INFLIGHT) -> dict:
+    """
+    ip -> доступен ли хотя бы один порт. Хосты, проверку которых не успели
+    закончить до deadline (например, ждали свободного слота), в результат
+    не попадают: их состояние неизвестно, а не "недоступен".
+    """
+    slots = asyncio.Semaphore(max_inflight)
+    tasks = {ip: asyncio.ensure_future(probe_host(ip, ports, timeout, slots)) for ip in dict.fromkeys(ips)}
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for t in pending:
+        t.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    return {ip: t.result() for ip, t in tasks.items() if t in done}
+
+
+def probe(ips, **kwargs) -> dict:
+    """Синхронная обёртка для вызова из потоков HTTP-сервера"""
+    return asyncio.run(probe_all(ips, **kwargs))
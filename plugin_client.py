@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Клиент локального плагина (порт 8081): пул постоянных HTTP/1.1 соединений,
+кэш проверки /health на HEALTH_TTL и автомат отключения - после нескольких
+сетевых ошибок подряд запросы к плагину сразу отклоняются, пока не пройдёт
+BREAKER_COOLDOWN, а не ждут таймаута соединения.
+"""
+
+import http.client
+import json
+import select
+import threading
+import time
+
+POOL_SIZE = 4  # простаивающих соединений в пуле
+POOL_IDLE = 10  # сек; дольше простаивавшее соединение плагин мог уже закрыть
+REQUEST_TIMEOUT = 10  # сек; установка идёт в плагине в фоне, ответы на запросы быстрые
+HEALTH_TIMEOUT = 0.5  # сек на ответ /health
+HEALTH_TTL = 2  # сек, сколько помним результат проверки
+BREAKER_THRESHOLD = 3  # сетевых ошибок подряд до отключения
+BREAKER_COOLDOWN = 5  # сек до пробного запроса после отключения
+
+
+class PluginUnavailable(OSError):
+    """Плагин не отвечает или отключён автоматом после ошибок"""
+
+
+class PluginClient:
+    def __init__(self, host="127.0.0.1", port=8081, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = []  # (соединение, время возврата в пул)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None  # когда сработал автомат; None - запросы идут
+        self._probing = False
+        self._health = None  # (результат, время проверки)
+        self._health_lock = threading.Lock()
+
+    # Пул соединений
+
+    def _acquire(self):
+        """(соединение, взято ли из пула)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._pool:
+                conn, released = self._pool.pop()
+                if now - released < POOL_IDLE and not self._dropped(conn):
+                    return conn, True
+                conn.close()
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    @staticmethod
+    def _dropped(conn):
+        """Плагин закрыл простаивающее соединение: сокет читается (EOF), хотя запроса не было"""
+        if conn.sock is None:
+            return True
+        try:
+            return bool(select.select([conn.sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for conn, _ in pool:
+            conn.close()
+
+    # Автомат отключения
+
+    def _allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < BREAKER_COOLDOWN:
+                return False
+            self._probing = True  # после паузы пропускаем один пробный запрос
+            return True
+
+    def _record(self, ok):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._opened_at is not None or self._failures >= BREAKER_THRESHOLD:
+                    self._opened_at = time.monotonic()
+        self._health = (ok, time.monotonic())
+
+    # Запросы
+
+    def _exchange(self, conn, method, path, body, timeout):
+        """(ответ, тело); у исключения request_sent - успел ли запрос уйти целиком"""
+        conn.timeout = timeout
+        if conn.sock:
+            conn.sock.settimeout(timeout)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        sent = False
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            sent = True
+            response = conn.getresponse()
+            return response, response.read()
+        except (OSError, http.client.HTTPException) as e:
+            e.request_sent = sent
+            raise
+
+    def _send(self, method, path, body, timeout):
+        """
+        (ответ, тело); если соединение из пула оказалось закрытым, запрос
+        повторяется в новом. POST повторяется, только если не был отправлен -
+        иначе плагин мог уже поставить установку в очередь.
+        """
+        conn, reused = self._acquire()
+        try:
+            response, payload = self._exchange(conn, method, path, body, timeout)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            if not reused or (method != "GET" and e.request_sent):
+                raise
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+            try:
+                response, payload = self._exchange(conn, method, path, body, timeout)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        return response, payload
+
+    def request(self, path, data=None, timeout=None):
+        """(HTTP-статус, JSON) ответа плагина; data - тело POST-запроса"""
+        if not self._allow():
+            raise PluginUnavailable("Plugin is not responding")
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        try:
+            response, payload = self._send("POST" if body is not None else "GET", path, body,
+                                           timeout or self.timeout)
+        except (OSError, http.client.HTTPException) as e:
+            self._record(False)
+            raise PluginUnavailable(f"Plugin is not responding: {e}") from e
+        self._record(True)
+        try:
+            return response.status, json.loads(payload.decode("utf-8"))
+        except ValueError:
+            return response.status, {"error": response.reason}
+
+    def healthy(self):
+        """Отвечает ли плагин на /health; результат кэшируется на HEALTH_TTL"""
+        health = self._health
+        if health and time.monotonic() - health[1] < HEALTH_TTL:
+            return health[0]
+        # Проверяет один поток, остальные получают прошлый результат
+        if not self._health_lock.acquire(blocking=health is None):
+            return health[0]
+        try:
+            health = self._health
+            if health and time.monotonic() - health[1] < HEALTH_TTL:
+                return health[0]
+            if not self._allow():
+                return False
+            try:
+                response, _ = self._send("GET", "/health", None, HEALTH_TIMEOUT)
+            except (OSError, http.client.HTTPException):
+                self._record(False)
+                return False
+            self._record(response.status == 200)
+            return response.status == 200
+        finally:
+            self._health_lock.release()
@@ -7,17 +7,29 @@ PrinterPlugin - Служба для автоматической установ
 
 import json
 import os
+import re
 import sys
 import time
 import subprocess
 import threading
 import socket
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import tempfile
 import shutil
 import logging
+import hashlib
+import itertools
+import http.client
+import urllib.error
 import urllib.parse
+import urllib.request
+import uuid
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import model_catalog
 
 # Настройка логирования
 logging.basicConfig(
@@ -30,99 +42,847 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class PluginHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        logger.info(f"{self.client_address[0]} - {format % args}")
+# Докачка файлов с сервера
+DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), 'PrinterPlugin', 'downloads')
+DOWNLOAD_SEGMENT = 4 * 1024 * 1024  # размер одного запроса Range
+DOWNLOAD_RETRIES = 5  # повторов подряд без прогресса
+DOWNLOAD_BACKOFF = 1.0  # первая пауза перед повтором, далее удваивается
+DOWNLOAD_TIMEOUT = 30
 
-    def do_GET(self):
-        """Обработка GET запросов"""
-        parsed = urlparse(self.path)
-        
-        if parsed.path == "/status":
-            # Проверка статуса службы
-            response = {"status": "running", "version": "1.0.0"}
-            self.send_json_response(response)
-            return
-            
-        elif parsed.path == "/health":
-            # Health check
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain")
-            self.end_headers()
-            self.wfile.write(b"OK")
+SERVER_URL = "http://127.0.0.1:8080"
+
+# Постоянный кэш драйверов: <модель>/<версия архива>/, вытеснение по давности использования
+DRIVER_CACHE_DIR = os.path.join(os.environ.get('ProgramData', tempfile.gettempdir()), 'PrinterPlugin', 'drivers')
+DRIVER_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DRIVER_CACHE_TTL = 3600  # сколько секунд версия считается актуальной без запроса к серверу
+DRIVER_CACHE_MANIFEST = '.manifest.json'
+BUNDLE_MANIFEST = 'manifest.json'  # расположение файлов, первый файл архива драйверов
+
+
+# Команды установки выполняются в одном долгоживущем процессе оболочки
+COMMAND_HOST = True
+COMMAND_HOST_SHELLS = 3  # оболочек для параллельных стадий установки
+COMMAND_TIMEOUT = 600  # сек на одну команду установки; зависшая команда убивается вместе с оболочкой
+
+# Установка очередей печати
+RAW_PORT = '9100'
+DRIVER_ARCH_VER = '3'
+DRIVER_ARCH_NAME = 'Windows x64'
+STOCK_PRINTERS_TO_REMOVE = ('Fax', 'Microsoft XPS Document Writer', 'OneNote for Windows 10', 'Anydesk printer')
+# Очереди, драйверы и порты одной командой; вывод - JSON в UTF-8 (имена очередей бывают кириллицей)
+SPOOLER_STATE_CMD = (
+    'powershell -NoProfile -NonInteractive -Command "'
+    '[Console]::OutputEncoding = [Text.Encoding]::UTF8; '
+    '$p = @(Get-CimInstance Win32_Printer | Select-Object Name, DriverName, PortName, Default); '
+    '$d = @(Get-PrinterDriver | Select-Object Name, DriverVersion); '
+    '$o = @(Get-PrinterPort | Select-Object Name, PrinterHostAddress, PortNumber); '
+    'ConvertTo-Json -Compress -Depth 3 @{printers = $p; drivers = $d; ports = $o}"'
+)
+
+# Очередь установок
+INSTALL_WORKERS = 2
+STAGE_WORKERS = 3  # одновременных стадий одной установки
+JOB_TTL = 3600  # сек, сколько хранятся завершённые задания
+JOB_STEPS = ('download', 'driver', 'configure', 'done')  # шаги установки, как в интерфейсе
+# Изменения в диспетчере печати и установки MSI выполняются по одной
+SPOOLER_LOCK = threading.RLock()
+# Ожидание состояния службы при перезапуске Spooler
+SERVICE_POLL_INITIAL = 0.05  # сек, первая пауза между опросами, дальше удваивается
+SERVICE_POLL_MAX = 1.0
+SERVICE_DEADLINE = 30  # сек на остановку или запуск
+MSI_LOCK = threading.Lock()
+
+
+def drivers_query(model, variant):
+    return f"model={urllib.parse.quote(model)}&variant={urllib.parse.quote(variant)}"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_bundle_layout(root, info):
+    """
+    Абсолютные пути драйвера и пакета сканера в распакованном архиве по его
+    manifest.json; для архивов без манифеста - по каталогу моделей
+    """
+    try:
+        with open(os.path.join(root, BUNDLE_MANIFEST), 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+    except (OSError, ValueError):
+        layout = {'driver': info.driver, 'driver_root': info.inf.rsplit('/', 1)[0], 'inf': info.inf,
+                  'twain_msi': info.twain_msi, 'quick_scan': info.quick_scan}
+
+    def path(rel):
+        return os.path.join(root, *rel.split('/')) if rel else None
+
+    return {'root': root, 'driver': layout.get('driver') or info.driver,
+            'driver_root': path(layout['driver_root']) or root, 'inf': path(layout['inf']),
+            'twain_msi': path(layout.get('twain_msi')), 'quick_scan': path(layout.get('quick_scan'))}
+
+
+def inf_driver_version(inf_path):
+    """Версия драйвера из строки DriverVer INF-файла: (1, 2, 3, 4) или None"""
+    try:
+        with open(inf_path, 'rb') as f:
+            raw = f.read()
+    except OSError:
+        return None
+    text = raw.decode('utf-16', errors='replace') if raw[:2] in (b'\xff\xfe', b'\xfe\xff') else raw.decode('latin-1')
+    m = re.search(r'^\s*DriverVer\s*=\s*[^,\r\n]*,\s*([\d.]+)', text, re.IGNORECASE | re.MULTILINE)
+    if not m:
+        return None
+    parts = [int(x) for x in m.group(1).split('.') if x][:4]
+    return tuple(parts + [0] * (4 - len(parts)))
+
+
+class DriverCache:
+    """
+    Распакованные драйверы моделей на диске. Версия собирается во временной
+    папке и появляется одним переименованием, поэтому недособранное дерево
+    никогда не используется. mtime папки версии - время последнего использования,
+    mtime манифеста - время последней сверки с сервером.
+    """
+
+    def __init__(self, root, max_bytes=DRIVER_CACHE_MAX_BYTES, ttl=DRIVER_CACHE_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()  # только учёт папок моделей и вытеснение
+        self._slots = {}  # папка модели -> [блокировка, сколько потоков её ждут или держат]
+
+    @contextmanager
+    def _slot_lock(self, slot):
+        """Одна модель собирается одним потоком; разные модели скачиваются параллельно"""
+        with self._lock:
+            entry = self._slots.setdefault(slot, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._slots[slot]
+
+    def slot_for(self, model, variant):
+        return os.path.join(self.root, hashlib.sha1(f"{model}|{variant}".encode('utf-8')).hexdigest()[:16])
+
+    def versions(self, slot):
+        """Готовые версии модели, самая свежая первой"""
+        try:
+            names = [n for n in os.listdir(slot) if not n.startswith('.')]
+        except OSError:
+            return []
+        paths = [os.path.join(slot, n) for n in names
+                 if os.path.isfile(os.path.join(slot, n, DRIVER_CACHE_MANIFEST))]
+        return sorted(paths, key=lambda p: os.path.getmtime(os.path.join(p, DRIVER_CACHE_MANIFEST)), reverse=True)
+
+    def load_manifest(self, path):
+        with open(os.path.join(path, DRIVER_CACHE_MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def verify(self, path, manifest):
+        """Целостность версии: размеры всех файлов, SHA-256 - только у файлов с изменившимся mtime"""
+        for item in manifest['files']:
+            file_path = os.path.join(path, item['path'])
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return False
+            if st.st_size != item['size']:
+                return False
+            if st.st_mtime_ns != item.get('mtime_ns') and file_sha256(file_path) != item['sha256']:
+                return False
+        return True
+
+    def get(self, model, variant, fetch_manifest, fetch_files):
+        """
+        Путь к актуальной версии драйверов модели.
+        fetch_manifest() возвращает манифест сервера, fetch_files(paths, dest)
+        раскладывает файлы в dest (paths=None - все файлы архива).
+        """
+        slot = self.slot_for(model, variant)
+        with self._slot_lock(slot):
+            self._remove_partials(slot)
+
+            current, current_manifest = None, None
+            for path in self.versions(slot):
+                try:
+                    manifest = self.load_manifest(path)
+                    if self.verify(path, manifest):
+                        current, current_manifest = path, manifest
+                        break
+                except (OSError, ValueError, KeyError):
+                    pass
+                logger.warning(f"Cached drivers at {path} are corrupted, removing")
+                shutil.rmtree(path, ignore_errors=True)
+
+            # Тёплый кэш: недавно сверенная версия используется без обращения к серверу
+            if current and time.time() - os.path.getmtime(os.path.join(current, DRIVER_CACHE_MANIFEST)) < self.ttl:
+                os.utime(current)
+                logger.info(f"Using cached drivers for {model}: {current}")
+                return current
+
+            try:
+                remote = fetch_manifest()
+            except (OSError, ValueError) as e:
+                if current:
+                    logger.warning(f"Server unavailable ({e}), using cached drivers for {model}")
+                    os.utime(current)
+                    return current
+                raise
+
+            target = os.path.join(slot, remote['key'][:16])
+            if current and os.path.normcase(current) == os.path.normcase(target):
+                os.utime(os.path.join(current, DRIVER_CACHE_MANIFEST))
+                os.utime(current)
+                logger.info(f"Cached drivers for {model} are up to date: {current}")
+                return current
+
+            self._populate(target, remote, current, current_manifest, fetch_files)
+            for path in self.versions(slot):
+                if path != target:
+                    shutil.rmtree(path, ignore_errors=True)
+            self.evict(keep=target)
+            return target
+
+    def _populate(self, target, remote, previous, previous_manifest, fetch_files):
+        """Собирает новую версию рядом с целевой папкой и переименовывает её одним шагом"""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = tempfile.mkdtemp(prefix='.partial-', dir=os.path.dirname(target))
+        try:
+            # Неизменившиеся файлы берём из предыдущей версии, остальные - с сервера
+            known = {f['path']: f['sha256'] for f in previous_manifest['files']} if previous_manifest else {}
+            missing = []
+            for item in remote['files']:
+                dest = os.path.join(partial, item['path'])
+                if known.get(item['path']) == item['sha256']:
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    try:
+                        os.link(os.path.join(previous, item['path']), dest)
+                    except OSError:
+                        shutil.copy2(os.path.join(previous, item['path']), dest)
+                else:
+                    missing.append(item['path'])
+            if missing:
+                fetch_files(None if len(missing) == len(remote['files']) else missing, partial)
+
+            local = dict(remote, files=[])
+            for item in remote['files']:
+                file_path = os.path.join(partial, item['path'])
+                if file_sha256(file_path) != item['sha256']:
+                    raise ValueError(f"Checksum mismatch for {item['path']}")
+                local['files'].append(dict(item, mtime_ns=os.stat(file_path).st_mtime_ns))
+            with open(os.path.join(partial, DRIVER_CACHE_MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump(local, f, ensure_ascii=False)
+            if 'layout' in remote:
+                # Версия, собранная из частей, тоже получает манифест архива
+                with open(os.path.join(partial, BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+                    json.dump(remote['layout'], f, ensure_ascii=False)
+
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(partial, target)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        logger.info(f"Cached drivers {os.path.basename(target)}: {len(missing)} downloaded, "
+                    f"{len(remote['files']) - len(missing)} reused")
+
+    def _remove_partials(self, slot):
+        """Остатки прерванной сборки"""
+        try:
+            names = os.listdir(slot)
+        except OSError:
             return
-            
-        else:
-            self.send_error(404, "Not Found")
+        for name in names:
+            if name.startswith('.partial-'):
+                shutil.rmtree(os.path.join(slot, name), ignore_errors=True)
 
-    def do_POST(self):
-        """Обработка POST запросов"""
-        parsed = urlparse(self.path)
-        
-        if parsed.path == "/install":
-            self.handle_install()
+    def evict(self, keep=None):
+        """Удаляет давно не использованные версии, пока кэш больше лимита"""
+        with self._lock:
+            self._evict(keep)
+
+    def _evict(self, keep):
+        # Папки моделей, которые сейчас собираются или проверяются, не трогаем
+        busy = {os.path.normcase(slot) for slot in self._slots}
+        entries = []
+        try:
+            slots = [os.path.join(self.root, n) for n in os.listdir(self.root)]
+        except OSError:
             return
-        else:
-            self.send_error(404, "Not Found")
+        for slot in slots:
+            for path in self.versions(slot):
+                try:
+                    size = sum(f['size'] for f in self.load_manifest(path)['files'])
+                    entries.append((os.path.getmtime(path), size, path, os.path.normcase(slot) in busy))
+                except (OSError, ValueError, KeyError):
+                    continue
+        total = sum(entry[1] for entry in entries)
+        for _, size, path, in_use in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep or in_use:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted cached drivers: {path}")
+        for slot in slots:
+            if os.path.normcase(slot) in busy:
+                continue
+            try:
+                os.rmdir(slot)  # удаляется только пустая
+            except OSError:
+                pass
 
-    def handle_install(self):
-        """Обработка запроса на установку принтера"""
+
+DRIVER_CACHE = DriverCache(DRIVER_CACHE_DIR)
+
+
+def _hidden_window_kwargs():
+    """Скрываем окна дочерних процессов (только Windows)"""
+    if os.name != 'nt':
+        return {}
+    si = subprocess.STARTUPINFO()
+    si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    si.wShowWindow = 0  # SW_HIDE
+    return {'startupinfo': si, 'creationflags': 0x08000000}  # CREATE_NO_WINDOW
+
+
+class SubprocessBackend:
+    """Каждая команда - отдельный процесс оболочки"""
+
+    def run_many(self, cmds):
+        """[(код возврата, stdout, stderr)] в байтах, по каждой команде"""
+        results = []
+        for cmd in cmds:
+            try:
+                proc = subprocess.run(cmd, capture_output=True, shell=True, stdin=subprocess.DEVNULL,
+                                      timeout=COMMAND_TIMEOUT, **_hidden_window_kwargs())
+            except subprocess.TimeoutExpired as e:
+                results.append((-1, e.stdout or b'', f'Command timed out after {COMMAND_TIMEOUT} s'.encode()))
+                continue
+            results.append((proc.returncode, proc.stdout or b'', proc.stderr or b''))
+        return results
+
+    def close(self):
+        pass
+
+
+class ShellHost:
+    """
+    Долгоживущие процессы оболочки (cmd.exe, на Linux - sh): команды
+    пишутся в stdin пачкой, вывод каждой - в свои временные файлы,
+    после каждой оболочка печатает метку с кодом возврата. Так не
+    запускается новая оболочка на каждый шаг установки, а stdout, stderr
+    и код возврата остаются раздельными по командам. Параллельные стадии
+    установки получают разные оболочки, не больше size одновременно.
+    """
+
+    def __init__(self, shell=None, size=COMMAND_HOST_SHELLS):
+        self.shell = shell or (['cmd.exe', '/Q', '/D'] if os.name == 'nt' else ['/bin/sh'])
+        self.size = size
+        self._idle = []
+        self._count = 0  # запущенных оболочек, включая занятые
+        self._cond = threading.Condition()
+        self._tmp = None
+        self._seq = itertools.count(1)
+        self._fallback = SubprocessBackend()
+        self.encoding = self._shell_encoding()
+
+    @staticmethod
+    def _shell_encoding():
+        """Кодировка, в которой оболочка читает команды из stdin"""
+        if os.name != 'nt':
+            return 'utf-8'
+        import ctypes
+        return f'cp{ctypes.windll.kernel32.GetOEMCP()}'  # cmd.exe читает в кодовой странице OEM (866)
+
+    def _encodable(self, text):
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            logger.info(f"Install request: {data}")
-            
-            # Валидация данных
-            required_fields = ['ip', 'model', 'variant']
-            for field in required_fields:
-                if field not in data:
-                    self.send_error(400, f"Missing required field: {field}")
-                    return
-            
-            # Выполняем установку синхронно
-            success = self.perform_installation(
-                data['ip'], 
-                data['model'], 
-                data['variant'], 
-                data.get('host', ''),
-                data.get('desc', '')
-            )
-            
-            if success:
-                response = {"success": True, "message": f"Successfully installed {data['model']}"}
+            text.encode(self.encoding)
+            return True
+        except UnicodeEncodeError:
+            return False
+
+    def _workdir(self):
+        """Папка для вывода команд; её путь тоже пишется в stdin, поэтому должен кодироваться"""
+        for root in (None, os.environ.get('ProgramData')):
+            try:
+                path = tempfile.mkdtemp(prefix='cmdhost_', dir=root)
+            except OSError:
+                continue
+            if self._encodable(path):
+                return path
+            shutil.rmtree(path, ignore_errors=True)
+        return None
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._count >= self.size:
+                self._cond.wait()
+            while self._idle:
+                proc = self._idle.pop()
+                if proc.poll() is None:
+                    return proc
+                self._count -= 1
+            self._count += 1
+            if self._tmp is None:
+                self._tmp = self._workdir()
+        try:
+            # Своя группа процессов на POSIX - чтобы убить зависшую команду вместе с оболочкой
+            proc = subprocess.Popen(self.shell, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, start_new_session=os.name != 'nt',
+                                    **_hidden_window_kwargs())
+        except OSError:
+            self._release(None)
+            raise
+        logger.info(f"Command host started: pid {proc.pid}")
+        return proc
+
+    def _release(self, proc, healthy=False):
+        with self._cond:
+            if proc and healthy:
+                self._idle.append(proc)
             else:
-                response = {"success": False, "error": f"Failed to install {data['model']}"}
-            
-            self.send_json_response(response)
-            
-        except Exception as e:
-            logger.error(f"Install error: {e}")
-            response = {"success": False, "error": str(e)}
-            self.send_json_response(response, status=500)
+                self._count -= 1
+                if proc:
+                    self._stop(proc)
+            self._cond.notify()
+
+    def _script(self, cmd, out_path, err_path, marker):
+        # stdin команды - пустой: иначе она (или PowerShell) дочитала бы пачку вместе с метками
+        if os.name == 'nt':
+            return f'{cmd} <NUL >"{out_path}" 2>"{err_path}"\r\necho {marker} %ERRORLEVEL%\r\n'
+        # В подоболочке: exit в команде не завершает сам хост
+        return f'({cmd}\n) </dev/null >"{out_path}" 2>"{err_path}"\necho {marker} $?\n'
+
+    def run_many(self, cmds):
+        """[(код возврата, stdout, stderr)] в байтах, по каждой команде, в порядке cmds"""
+        results, batch = [], []
+        for cmd in cmds:
+            # Многострочные команды (powershell -Command "...") в построчный stdin не передать,
+            # как и символы вне кодировки оболочки - такие идут отдельным процессом
+            if '\n' not in cmd and self._encodable(cmd):
+                batch.append(cmd)
+                continue
+            # Сначала то, что было перед ней: порядок команд сохраняется
+            results += self._run_batch(batch)
+            batch = []
+            results += self._fallback.run_many([cmd])
+        return results + self._run_batch(batch)
 
-    def install_printer(self, data):
-        """Установка принтера в отдельном потоке"""
+    def _run_batch(self, cmds):
+        """Команды одной пачкой в оболочке хоста"""
+        if not cmds:
+            return []
+        proc = self._acquire()
+        if self._tmp is None:
+            # Ни одна временная папка не записывается в кодировке оболочки
+            self._release(proc, healthy=True)
+            return self._fallback.run_many(cmds)
+        results = [None] * len(cmds)
+        steps, script = [], ''
+        for i, cmd in enumerate(cmds):
+            seq = next(self._seq)
+            marker = f'__CMDHOST_{seq}__'
+            out_path = os.path.join(self._tmp, f'{seq}.out')
+            err_path = os.path.join(self._tmp, f'{seq}.err')
+            steps.append((i, marker, out_path, err_path))
+            script += self._script(cmd, out_path, err_path, marker)
         try:
-            ip = data['ip']
-            model = data['model']
-            variant = data['variant']
-            host = data.get('host', '')
-            
-            logger.info(f"Installing printer: {model} at {ip} (variant: {variant})")
-            
-            # Здесь должна быть логика установки принтера
-            # Пока что имитируем установку
-            success = self.perform_installation(ip, model, variant, host)
-            
-            if success:
-                logger.info(f"Successfully installed {model} at {ip}")
+            proc.stdin.write(script.encode(self.encoding))
+            proc.stdin.flush()
+            for n, (i, marker, out_path, err_path) in enumerate(steps):
+                rc = self._read_marker(proc, marker, COMMAND_TIMEOUT)
+                if rc is None:
+                    # Оболочка убита вместе с зависшей командой; остальные команды - в новой
+                    logger.error(f"Command timed out after {COMMAND_TIMEOUT} s: {cmds[i]}")
+                    self._release(proc)
+                    results[i] = (-1, self._take(out_path), f'Command timed out after {COMMAND_TIMEOUT} s'.encode())
+                    self._take(err_path)
+                    rest = [j for j, *_ in steps[n + 1:]]
+                    if rest:
+                        for j, result in zip(rest, self.run_many([cmds[j] for j in rest])):
+                            results[j] = result
+                    return results
+                results[i] = (rc, self._take(out_path), self._take(err_path))
+        except (OSError, ValueError) as e:
+            # Оболочка упала - следующий вызов запустит новую
+            self._release(proc)
+            raise RuntimeError(f'Command host failed: {e}')
+        self._release(proc, healthy=True)
+        return results
+
+    @classmethod
+    def _read_marker(cls, proc, marker, timeout):
+        """Код возврата команды или None, если она не уложилась в timeout (оболочка убита)"""
+        prefix = marker.encode('ascii') + b' '
+        expired = threading.Event()
+
+        def kill():
+            expired.set()
+            cls._kill(proc)
+
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            while True:
+                line = proc.stdout.readline()
+                if not line:
+                    if expired.is_set():
+                        return None
+                    raise OSError('command host exited')
+                line = line.strip()
+                if line.startswith(prefix):
+                    return int(line[len(prefix):])
+        finally:
+            timer.cancel()
+
+    @staticmethod
+    def _kill(proc):
+        """Оболочка и все запущенные ею процессы"""
+        try:
+            if os.name == 'nt':
+                subprocess.run(['taskkill', '/F', '/T', '/PID', str(proc.pid)], capture_output=True,
+                               **_hidden_window_kwargs())
             else:
-                logger.error(f"Failed to install {model} at {ip}")
-                
-        except Exception as e:
-            logger.error(f"Installation thread error: {e}")
+                os.killpg(proc.pid, 9)
+        except OSError:
+            pass
+        proc.kill()
+
+    @staticmethod
+    def _take(path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.remove(path)
+            return data
+        except OSError:
+            return b''
+
+    @staticmethod
+    def _stop(proc):
+        if proc.poll() is None:
+            try:
+                proc.stdin.close()
+                proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                proc.kill()
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+            tmp, self._tmp = self._tmp, None
+        for proc in idle:
+            self._stop(proc)
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+class FakeBackend:
+    """
+    Для тестов и замеров на Linux: handler(cmd) -> (код, stdout, stderr) в байтах,
+    spawn_delay - имитация запуска процесса на каждую команду. Команды - в calls.
+    """
+
+    def __init__(self, handler=None, spawn_delay=0.0):
+        self.handler = handler or (lambda cmd: (0, b'', b''))
+        self.spawn_delay = spawn_delay
+        self.calls = []
+
+    def run_many(self, cmds):
+        results = []
+        for cmd in cmds:
+            if self.spawn_delay:
+                time.sleep(self.spawn_delay)
+            self.calls.append(cmd)
+            results.append(self.handler(cmd))
+        return results
+
+    def close(self):
+        pass
+
+
+_command_backend = None
+_command_backend_lock = threading.Lock()
+
+
+def get_command_backend():
+    """Исполнитель команд установки (по умолчанию - ShellHost), создаётся один раз"""
+    global _command_backend
+    if _command_backend is None:
+        with _command_backend_lock:
+            if _command_backend is None:
+                _command_backend = ShellHost() if COMMAND_HOST else SubprocessBackend()
+    return _command_backend
+
+
+def set_command_backend(backend):
+    global _command_backend
+    with _command_backend_lock:
+        old, _command_backend = _command_backend, backend
+    if old and old is not backend:
+        old.close()
+
+
+def _as_list(value):
+    # ConvertTo-Json в старых PowerShell разворачивает массив из одного элемента
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class SpoolerState:
+    """
+    Снимок очередей, драйверов и портов печати на компьютере (одна команда
+    PowerShell). Имена сравниваются без учёта регистра, как в Windows.
+    Установка обновляет снимок сама, поэтому он верен до конца задания.
+    """
+
+    def __init__(self, printers=(), drivers=(), ports=()):
+        self.printers = {p['Name'].lower(): {'driver': p.get('DriverName') or '', 'port': p.get('PortName') or '',
+                                             'default': bool(p.get('Default'))} for p in printers}
+        self.drivers = {d['Name'].lower(): self._version(d.get('DriverVersion')) for d in drivers}
+        self.ports = {o['Name'].lower(): {'host': o.get('PrinterHostAddress') or '', 'number': o.get('PortNumber')}
+                      for o in ports}
+
+    @staticmethod
+    def _version(value):
+        if value is None:
+            return None
+        v = int(value)
+        return (v >> 48 & 0xffff, v >> 32 & 0xffff, v >> 16 & 0xffff, v & 0xffff)
+
+    @classmethod
+    def snapshot(cls, run_cmd):
+        """Снимок через run_cmd или None, если снять не удалось (тогда выполняются все шаги)"""
+        try:
+            rc, out, err = run_cmd(SPOOLER_STATE_CMD)
+            if rc != 0:
+                raise ValueError(err.strip() or f'exit code {rc}')
+            data = json.loads(out)
+            state = cls(_as_list(data.get('printers')), _as_list(data.get('drivers')), _as_list(data.get('ports')))
+        except (OSError, RuntimeError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Spooler state unavailable ({e}), applying every install step")
+            return None
+        logger.info(f"Spooler state: {len(state.printers)} printers, {len(state.drivers)} drivers, {len(state.ports)} ports")
+        return state
+
+    def has_printer(self, name):
+        return name.lower() in self.printers
+
+    def printer_matches(self, name, driver, port):
+        p = self.printers.get(name.lower())
+        return bool(p) and p['driver'].lower() == driver.lower() and p['port'].lower() == port.lower()
+
+    def is_default(self, name):
+        p = self.printers.get(name.lower())
+        return bool(p) and p['default']
+
+    def has_driver(self, name):
+        return name.lower() in self.drivers
+
+    def driver_version(self, name):
+        return self.drivers.get(name.lower())
+
+    def port_matches(self, name, host, number):
+        o = self.ports.get(name.lower())
+        return bool(o) and o['host'].lower() == host.lower() and str(o['number']) == str(number)
+
+    def remove_printer(self, name):
+        self.printers.pop(name.lower(), None)
+
+    def add_printer(self, name, driver, port):
+        self.printers[name.lower()] = {'driver': driver, 'port': port, 'default': False}
+
+    def set_default(self, name):
+        for key, p in self.printers.items():
+            p['default'] = key == name.lower()
+
+    def add_driver(self, name, version):
+        self.drivers[name.lower()] = version
+
+    def remove_driver(self, name):
+        self.drivers.pop(name.lower(), None)
+
+    def add_port(self, name, host, number):
+        self.ports[name.lower()] = {'host': host, 'number': number}
+
+
+class ScController:
+    """Состояние и запуск служб Windows через sc.exe; run_cmd - как у PrinterInstaller"""
+
+    STATES = {1: 'stopped', 2: 'start_pending', 3: 'stop_pending', 4: 'running',
+              5: 'continue_pending', 6: 'pause_pending', 7: 'paused'}
+
+    def __init__(self, run_cmd):
+        self.run_cmd = run_cmd
+
+    def query(self, name):
+        rc, out, err = self.run_cmd(f'sc query "{name}"')
+        # Строка "STATE : 4 RUNNING" локализована, кроме кода состояния
+        m = re.search(r':\s*(\d)\s+[A-Z_]+', out)
+        if rc != 0 or not m:
+            raise RuntimeError(f"sc query {name} failed: {(err or out).strip() or rc}")
+        return self.STATES.get(int(m.group(1)), 'unknown')
+
+    def stop(self, name):
+        self.run_cmd(f'sc stop "{name}"')
+
+    def start(self, name):
+        self.run_cmd(f'sc start "{name}"')
+
+
+class FakeServiceController:
+    """
+    Служба-заглушка для тестов без Windows: после stop/start состояние
+    меняется через stop_delay/start_delay секунд. Команды - в calls.
+    """
+
+    def __init__(self, state='running', stop_delay=0.0, start_delay=0.0):
+        self.stop_delay = stop_delay
+        self.start_delay = start_delay
+        self.calls = []
+        self._state = state
+        self._target = None
+        self._ready_at = 0.0
+
+    def query(self, name):
+        self.calls.append(('query', name))
+        if self._target and time.monotonic() >= self._ready_at:
+            self._state, self._target = self._target, None
+        return self._state
+
+    def stop(self, name):
+        self.calls.append(('stop', name))
+        if self._state == 'running':
+            self._state, self._target = 'stop_pending', 'stopped'
+            self._ready_at = time.monotonic() + self.stop_delay
+
+    def start(self, name):
+        self.calls.append(('start', name))
+        if self._state == 'stopped':
+            self._state, self._target = 'start_pending', 'running'
+            self._ready_at = time.monotonic() + self.start_delay
+
+
+class ServiceControl:
+    """
+    Остановка и запуск службы с ожиданием нужного состояния: опрос с
+    экспоненциальной паузой (от poll_initial до poll_max) и общим сроком deadline
+    """
+
+    def __init__(self, controller, poll_initial=SERVICE_POLL_INITIAL, poll_max=SERVICE_POLL_MAX,
+                 deadline=SERVICE_DEADLINE):
+        self.controller = controller
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.deadline = deadline
+
+    def wait_for(self, name, state, started=None):
+        """Ждёт состояния state; секунды от started (по умолчанию - от вызова), TimeoutError по сроку"""
+        started = time.monotonic() if started is None else started
+        limit = started + self.deadline
+        delay = self.poll_initial
+        while True:
+            current = self.controller.query(name)
+            now = time.monotonic()
+            if current == state:
+                return now - started
+            if now >= limit:
+                raise TimeoutError(f"{name} is {current}, not {state} after {now - started:.1f}s")
+            time.sleep(min(delay, limit - now))
+            delay = min(delay * 2, self.poll_max)
+
+    def stop(self, name):
+        """Секунды до фактической остановки"""
+        started = time.monotonic()
+        if self.controller.query(name) != 'stopped':
+            self.controller.stop(name)
+        return self.wait_for(name, 'stopped', started)
+
+    def start(self, name):
+        """Секунды до фактического запуска"""
+        started = time.monotonic()
+        if self.controller.query(name) != 'running':
+            self.controller.start(name)
+        return self.wait_for(name, 'running', started)
+
+    def restart(self, name):
+        """{'stop': секунды, 'start': секунды}"""
+        return {'stop': self.stop(name), 'start': self.start(name)}
+
+
+def run_stages(stages, workers=STAGE_WORKERS):
+    """
+    Выполнение стадий {имя: (функция, [зависимости])}: стадия запускается,
+    когда успешно завершились все её зависимости, независимые - параллельно
+    (не больше workers). Стадия неуспешна, если функция упала или вернула
+    False; зависящие от неё стадии не запускаются.
+    Результат: {имя: True/False}.
+    """
+    for name, (_, deps) in stages.items():
+        unknown = [d for d in deps if d not in stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on unknown stages: {unknown}")
+
+    results = {}
+    pending = dict(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stage') as pool:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for name, (func, deps) in list(pending.items()):
+                    if any(results.get(d) is False for d in deps):
+                        logger.warning(f"Stage {name} skipped: dependency failed")
+                        results[name] = False
+                    elif all(results.get(d) for d in deps):
+                        running[pool.submit(func)] = name
+                    else:
+                        continue
+                    del pending[name]
+                    changed = True
+            if not running:
+                raise ValueError(f"Stage dependency cycle: {sorted(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result() is not False
+                except Exception as e:
+                    logger.error(f"Stage {name} failed: {e}")
+                    results[name] = False
+    return results
+
+
+class PrinterInstaller:
+    """
+    Установка принтера и сканера на этом компьютере. progress(step, message)
+    получает ход установки по шагам JOB_STEPS.
+    """
+
+    def __init__(self, progress=None, services=None):
+        self._progress = progress
+        self.services = services or ServiceControl(ScController(self.run_cmd))
+        self._state = None  # SpoolerState на время задания; False - снять не удалось
+
+    def report(self, step, message):
+        logger.info(f"[{step}] {message}")
+        if self._progress:
+            self._progress(step, message)
 
     def perform_installation(self, ip, model, variant, host, desc=''):
         """Выполнение установки принтера/сканера через CMD команды"""
@@ -130,25 +890,23 @@ class PluginHandler(BaseHTTPRequestHandler):
             logger.info(f"Installing {model} at {ip} (host: {host})")
             
             # Загружаем драйверы с сервера
-            drivers_path = self.download_drivers(model)
-            if not drivers_path:
+            self.report('download', f'Загрузка драйверов {model}')
+            drivers = self.download_drivers(model, variant)
+            if not drivers:
                 logger.error(f"Failed to download drivers for {model}")
                 return False
             
-            success = True
-            
-            # Устанавливаем принтер если нужно
+            # Принтер и сканер не зависят друг от друга - стадии идут параллельно
+            stages = {}
             if variant in ['printer', 'all']:
-                printer_success = self.install_printer_cmd(ip, model, host, desc, drivers_path)
-                success = success and printer_success
-            
-            # Устанавливаем сканер если нужно
+                stages['printer'] = (lambda: self.install_printer_locked(ip, model, host, desc, drivers), [])
             if variant in ['scanner', 'all']:
-                scanner_success = self.install_scanner_cmd(ip, model, host, drivers_path)
-                success = success and scanner_success
+                stages.update(self.scanner_stages(ip, model, host, drivers))
+            success = all(run_stages(stages).values())
             
-            # Очищаем временные файлы
-            self.cleanup_temp_files(drivers_path)
+            # Очищаем временные файлы (драйверы из кэша остаются для следующих установок)
+            if not os.path.abspath(drivers['root']).startswith(os.path.abspath(DRIVER_CACHE_DIR)):
+                self.cleanup_temp_files(drivers['root'])
             
             if success:
                 logger.info(f"Successfully installed {model} at {ip}")
@@ -161,277 +919,482 @@ class PluginHandler(BaseHTTPRequestHandler):
             logger.error(f"Installation error: {e}")
             return False
 
-    def download_drivers(self, model):
-        """Загрузка драйверов с сервера"""
+    def perform_batch(self, items):
+        """
+        Установка нескольких принтеров за раз: архив драйверов каждой модели
+        качается один раз, каждый драйвер ставится один раз, Spooler
+        перезапускается не больше одного раза. Результат - по каждому элементу.
+        """
+        results = [{'ip': it.get('ip'), 'model': it.get('model'), 'variant': it.get('variant'),
+                    'success': False, 'error': None} for it in items]
+
+        def fail(i, error):
+            results[i]['success'] = False
+            results[i]['error'] = error
+            logger.error(f"Batch item {items[i].get('ip')} ({items[i].get('model')}): {error}")
+
+        # 1) Драйверы: по одному архиву на модель, вариант - объединение вариантов элементов
+        variants = {}
+        for it in items:
+            variants.setdefault(it['model'], set()).add(it['variant'])
+        bundles = {}
+        for n, (model, vs) in enumerate(variants.items(), 1):
+            variant = vs.pop() if len(vs) == 1 else 'all'
+            self.report('download', f'Загрузка драйверов {model} ({n}/{len(variants)})')
+            bundles[model] = self.download_drivers(model, variant)
+        for i, it in enumerate(items):
+            if not bundles[it['model']]:
+                fail(i, f"Failed to download drivers for {it['model']}")
+            else:
+                results[i]['success'] = True
+
+        # 2) Принтеры: общий список удаляемых очередей, драйвер - один раз на модель драйвера
+        printers = [i for i, it in enumerate(items)
+                    if results[i]['success'] and it['variant'] in ('printer', 'all')]
+        scanners = [i for i, it in enumerate(items)
+                    if results[i]['success'] and it['variant'] in ('scanner', 'all')]
+
+        def install_printers():
+            with SPOOLER_LOCK:
+                self.install_printer_batch(items, printers, bundles, fail)
+
+        # 3) Сканеры: MSI и Quick Scan - один раз на модель, настройка - для каждого
+        #    (по очереди: настройки TWAIN пишутся в одни и те же файлы)
+        def install_scanners():
+            scanned = set()
+            for i in scanners:
+                it = items[i]
+                model = it['model']
+                if not self.install_scanner_cmd(it['ip'], model, it.get('host', ''), bundles[model],
+                                                packages=model not in scanned):
+                    fail(i, f"Failed to install scanner for {model}")
+                scanned.add(model)
+
+        # Принтеры и сканеры ставятся параллельно
+        stages = {}
+        if printers:
+            stages['printers'] = (install_printers, [])
+        if scanners:
+            stages['scanners'] = (install_scanners, [])
+        run_stages(stages)
+
+        for drivers in bundles.values():
+            if drivers and not os.path.abspath(drivers['root']).startswith(os.path.abspath(DRIVER_CACHE_DIR)):
+                self.cleanup_temp_files(drivers['root'])
+
+        ok = sum(r['success'] for r in results)
+        logger.info(f"Batch installed {ok}/{len(results)} items")
+        return results
+
+    def install_printer_batch(self, items, indexes, bundles, fail):
+        """Очереди печати для элементов indexes; ошибки - через fail(индекс, текст)"""
         try:
-            import urllib.request
-            import zipfile
-            import tempfile
-            
-            # Создаем временную папку для драйверов
-            temp_dir = tempfile.mkdtemp(prefix='printer_drivers_')
-            
-            # URL для скачивания драйверов
-            url = f"http://127.0.0.1:8080/dl/drivers?model={urllib.parse.quote(model)}"
-            
-            logger.info(f"Downloading drivers from: {url}")
-            
-            # Скачиваем архив с драйверами
-            zip_path = os.path.join(temp_dir, "drivers.zip")
-            urllib.request.urlretrieve(url, zip_path)
-            
-            # Распаковываем архив
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # Удаляем zip файл
-            os.remove(zip_path)
-            
-            # Ищем папку с драйверами
-            drivers_path = None
-            
-            # Определяем какие INF файлы искать в зависимости от модели
-            if "LBP223" in model.upper() or "MF428" in model.upper():
-                inf_files = ["CNLB0MA64.INF", "CNLB0M.INF"]
+            scripts = self.find_admin_scripts()
+        except FileNotFoundError as e:
+            for i in indexes:
+                fail(i, str(e))
+            return
+
+        queues = {}
+        for i in indexes:
+            it = items[i]
+            queue = self.printer_queue(it['model'], it.get('host', ''), it.get('desc', ''), bundles[it['model']])
+            if queue:
+                queues[i] = queue
             else:
-                inf_files = ["OEMSETUP.INF"]
-            
-            # Сначала проверяем корневую папку на наличие INF файла
-            for inf_file in inf_files:
-                if os.path.exists(os.path.join(temp_dir, inf_file)):
-                    drivers_path = temp_dir
-                    break
-            
-            if not drivers_path:
-                # Ищем папку drivers или x64/Driver
-                for item in os.listdir(temp_dir):
-                    item_path = os.path.join(temp_dir, item)
-                    if os.path.isdir(item_path):
-                        # Проверяем папку drivers
-                        if item == "drivers":
-                            drivers_path = item_path
-                            break
-                        # Проверяем папку x64/Driver для Canon
-                        elif item == "x64":
-                            driver_path = os.path.join(item_path, "Driver")
-                            if os.path.exists(driver_path):
-                                drivers_path = driver_path
-                                break
-                        # Проверяем, есть ли INF файл в этой подпапке
-                        else:
-                            for inf_file in inf_files:
-                                if os.path.exists(os.path.join(item_path, inf_file)):
-                                    drivers_path = item_path
-                                    break
-                            if drivers_path:
-                                break
-                            
-                            # Если не нашли в корне, ищем в подпапках (например, MF429/x64/Driver)
-                            for subitem in os.listdir(item_path):
-                                subitem_path = os.path.join(item_path, subitem)
-                                if os.path.isdir(subitem_path):
-                                    # Проверяем папку x64/Driver в подпапке
-                                    if subitem == "x64":
-                                        driver_path = os.path.join(subitem_path, "Driver")
-                                        if os.path.exists(driver_path):
-                                            drivers_path = driver_path
-                                            break
-                                    # Проверяем INF файлы в подпапке
-                                    for inf_file in inf_files:
-                                        if os.path.exists(os.path.join(subitem_path, inf_file)):
-                                            drivers_path = subitem_path
-                                            break
-                                if drivers_path:
-                                    break
-                            if drivers_path:
-                                break
-            
-            if not drivers_path:
-                logger.error("No drivers directory found in archive")
+                fail(i, f"Model {it['model']} is not in the catalog")
+
+        self.remove_printers(scripts, [name for q in queues.values() for name in q['remove']],
+                             keep=[q['name'] for q in queues.values() if self.queue_current(q)])
+
+        # Драйвер - один раз на модель драйвера; не вставшие повторяем после одного перезапуска Spooler
+        drivers = {}
+        for q in queues.values():
+            if not self.driver_current(q):
+                drivers.setdefault(q['driver'], q)
+        failed = []
+        for n, (name, q) in enumerate(drivers.items(), 1):
+            self.report('driver', f'Установка драйвера {name} ({n}/{len(drivers)})')
+            if not self.install_driver(scripts, q):
+                failed.append(name)
+        if failed:
+            logger.info(f'Drivers not installed on first try: {failed}, restarting Spooler once...')
+            self.stop_start_spooler()
+            failed = [name for name in failed if not self.install_driver(scripts, drivers[name], check=False)]
+        for i, q in list(queues.items()):
+            if q['driver'] in failed:
+                fail(i, f"Failed to install driver {q['driver']}")
+                del queues[i]
+
+        # Порты и очереди; по умолчанию - последний установленный, как при установке по одному
+        installed = []
+        for n, (i, q) in enumerate(queues.items(), 1):
+            self.report('configure', f'Настройка очереди "{q["name"]}" ({n}/{len(queues)})')
+            try:
+                self.add_printer_queue(scripts, q)
+                installed.append(q)
+            except Exception as e:
+                fail(i, str(e))
+        if installed:
+            try:
+                self.set_default_printer(scripts, installed[-1]['name'])
+            except Exception as e:
+                logger.error(f"Failed to set default printer: {e}")
+
+    def download_drivers(self, model, variant='all'):
+        """Загрузка драйверов с сервера (только файлы, нужные для модели); пути из read_bundle_layout()"""
+        try:
+            info = model_catalog.resolve(model)
+            if not info:
+                logger.error(f"Model {model} is not in the catalog")
+                return None
+
+            try:
+                root = DRIVER_CACHE.get(
+                    model, variant,
+                    lambda: self.fetch_drivers_manifest(model, variant),
+                    lambda paths, dest: self.fetch_driver_files(model, variant, paths, dest))
+            except (OSError, ValueError, KeyError) as e:
+                # Старый сервер без манифеста или недоступный каталог кэша - качаем архив во временную папку
+                logger.warning(f"Drivers cache unavailable ({e}), downloading full archive")
+                root = self.download_drivers_archive(model, variant)
+
+            # Расположение файлов - из манифеста архива, без обхода папок
+            drivers = read_bundle_layout(root, info)
+            if not os.path.isfile(drivers['inf']):
+                logger.error(f"INF file not found: {drivers['inf']}")
                 return None
             
-            logger.info(f"Drivers extracted to: {drivers_path}")
-            return drivers_path
+            logger.info(f"Drivers extracted to: {drivers['driver_root']}")
+            return drivers
             
         except Exception as e:
             logger.error(f"Failed to download drivers: {e}")
             return None
 
-    def install_printer_cmd(self, ip, model, host, desc, drivers_path):
+    def download_drivers_archive(self, model, variant):
+        """Скачивание и распаковка полного архива драйверов во временную папку"""
+        temp_dir = tempfile.mkdtemp(prefix='printer_drivers_')
+        url = f"{SERVER_URL}/dl/drivers?{drivers_query(model, variant)}"
+        logger.info(f"Downloading drivers from: {url}")
+
+        zip_path = os.path.join(temp_dir, "drivers.zip")
+        self.download_file(url, zip_path)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(temp_dir)
+        os.remove(zip_path)
+        return temp_dir
+
+    def fetch_drivers_manifest(self, model, variant):
+        """Манифест архива драйверов модели: пути, размеры и SHA-256 файлов"""
+        url = f"{SERVER_URL}/api/drivers/manifest?{drivers_query(model, variant)}"
+        with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+
+    def fetch_driver_files(self, model, variant, paths, dest_dir):
+        """Скачивает и распаковывает в dest_dir весь архив (paths=None) или только указанные файлы"""
+        zip_path = os.path.join(dest_dir, '.download.zip')
+        if paths is None:
+            # Полный архив - с докачкой
+            self.download_file(f"{SERVER_URL}/dl/drivers?{drivers_query(model, variant)}", zip_path)
+        else:
+            body = json.dumps({'model': model, 'variant': variant, 'paths': paths}).encode('utf-8')
+            req = urllib.request.Request(f"{SERVER_URL}/dl/drivers/delta", data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as resp, open(zip_path, 'wb') as f:
+                shutil.copyfileobj(resp, f, 64 * 1024)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(dest_dir)
+        os.remove(zip_path)
+
+    def download_file(self, url, dest_path):
+        """
+        Докачиваемая загрузка: файл скачивается сегментами через Range,
+        обрывы повторяются с нарастающей паузой, а принятые байты и ETag
+        записываются в журнал рядом с частичным файлом. Повторный вызов
+        для того же URL продолжает загрузку с места обрыва.
+        """
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        part_path = os.path.join(DOWNLOAD_DIR, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.part')
+        journal_path = part_path + '.json'
+
+        journal = {"url": url, "etag": None, "total": None, "received": 0}
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get("url") == url and os.path.exists(part_path):
+                journal.update(saved)
+                # В журнал пишем только после fsync данных, но файл мог оказаться короче
+                journal["received"] = min(journal["received"], os.path.getsize(part_path))
+                logger.info(f"Resuming download of {url} from byte {journal['received']}")
+        except (OSError, ValueError):
+            pass
+
+        def save_journal():
+            with open(journal_path, 'w', encoding='utf-8') as f:
+                json.dump(journal, f)
+
+        failures = 0
+        while journal["total"] is None or journal["received"] < journal["total"]:
+            start = journal["received"]
+            end = start + DOWNLOAD_SEGMENT - 1
+            if journal["total"] is not None:
+                end = min(end, journal["total"] - 1)
+            headers = {'Range': f'bytes={start}-{end}'}
+            if journal["etag"] and start > 0:
+                headers['If-Range'] = journal["etag"]
+
+            try:
+                req = urllib.request.Request(url, headers=headers)
+                with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
+                    if response.status == 206:
+                        content_range = response.headers.get('Content-Range', '')
+                        journal["total"] = int(content_range.rsplit('/', 1)[1])
+                    else:
+                        # Сервер прислал файл целиком: Range не поддерживается или файл изменился
+                        start = 0
+                        length = response.headers.get('Content-Length')
+                        journal["total"] = int(length) if length else None
+                    journal["etag"] = response.headers.get('ETag') or journal["etag"]
+
+                    with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
+                        f.seek(start)
+                        f.truncate()
+                        journal["received"] = start
+                        while True:
+                            chunk = response.read(64 * 1024)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            journal["received"] += len(chunk)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    if journal["total"] is None:
+                        journal["total"] = journal["received"]
+                failures = 0
+            except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError, IndexError) as e:
+                if isinstance(e, urllib.error.HTTPError):
+                    if e.code == 416:
+                        # Частичный файл больше не соответствует серверному - начинаем заново
+                        journal.update(etag=None, total=None, received=0)
+                    elif 400 <= e.code < 500 and e.code not in (408, 429):
+                        raise
+                failures += 1
+                if failures > DOWNLOAD_RETRIES:
+                    save_journal()
+                    raise
+                delay = DOWNLOAD_BACKOFF * 2 ** (failures - 1)
+                logger.warning(f"Download error ({e}), retry {failures}/{DOWNLOAD_RETRIES} in {delay:g}s")
+                time.sleep(delay)
+            finally:
+                if os.path.exists(part_path):
+                    save_journal()
+
+        os.replace(part_path, dest_path)
+        try:
+            os.remove(journal_path)
+        except OSError:
+            pass
+        logger.info(f"Downloaded {journal['received']} bytes to {dest_path}")
+
+    def install_printer_cmd(self, ip, model, host, desc, drivers):
         """Установка принтера через CMD команды (как в kyocera_print.py)"""
         try:
             logger.info(f"Installing printer: model='{model}', host='{host}', desc='{desc}'")
-            # Параметры для установки - используем model, host и desc из SAVED_PRINTERS
-            if "P3145" in model.upper():
-                prn_model_name = 'Kyocera ECOSYS P3145dn KX'
-                prn_queue_name = f'ECOSYS P3145dn ({desc})' if desc else 'ECOSYS P3145dn'
-                port_name = host  # Используем host как имя порта
-            elif "M2040" in model.upper():
-                prn_model_name = 'Kyocera ECOSYS M2040dn KX'
-                prn_queue_name = f'ECOSYS M2040dn ({desc})' if desc else 'ECOSYS M2040dn'
-                port_name = host  # Используем host как имя порта
-            elif "LBP223" in model.upper():
-                prn_model_name = 'Canon Generic Plus UFR II'
-                prn_queue_name = f'LBP223DW ({desc})' if desc else 'LBP223DW'
-                port_name = host  # Используем host как имя порта
-                logger.info(f"Using Canon driver: {prn_model_name}")
-            elif "MF428" in model.upper():
-                prn_model_name = 'Canon Generic Plus UFR II'
-                prn_queue_name = f'MF428X ({desc})' if desc else 'MF428X'
-                port_name = host  # Используем host как имя порта
-                logger.info(f"Using Canon driver: {prn_model_name}")
-            else:
-                prn_model_name = f'Kyocera {model} KX'
-                prn_queue_name = f'{model} ({desc})' if desc else model
-                port_name = host  # Используем host как имя порта
-                logger.info(f"Using Kyocera driver: {prn_model_name}")
-            
-            raw_port = '9100'
-            arch_ver = '3'
-            arch_name = 'Windows x64'
-            
-            # Определяем имя INF файла в зависимости от производителя
-            if "LBP223" in model.upper() or "MF428" in model.upper():
-                inf_name = 'CNLB0MA64.INF'  # Canon INF файл
-            else:
-                inf_name = 'OEMSETUP.INF'   # Kyocera INF файл
-            
-            # Находим INF файл
-            inf_path = None
-            
-            # Сначала ищем в корневой папке
-            if os.path.exists(os.path.join(drivers_path, inf_name)):
-                inf_path = os.path.join(drivers_path, inf_name)
-            else:
-                # Ищем INF файл в подпапках
-                for root, dirs, files in os.walk(drivers_path):
-                    for file in files:
-                        if file.upper() == inf_name.upper():
-                            inf_path = os.path.join(root, file)
-                            break
-                    if inf_path:
-                        break
-                
-                # Если не нашли конкретный файл, ищем любой INF
-                if not inf_path:
-                    for root, dirs, files in os.walk(drivers_path):
-                        for file in files:
-                            if file.upper().endswith('.INF'):
-                                inf_path = os.path.join(root, file)
-                                break
-                        if inf_path:
-                            break
-            
-            if not inf_path or not os.path.exists(inf_path):
-                logger.error(f"INF file not found in {drivers_path}")
+            queue = self.printer_queue(model, host, desc, drivers)
+            if not queue:
                 return False
-            
-            logger.info(f"Found INF file: {inf_path}")
-            
-            # Находим скрипты Windows
-            prnmngr_vbs, prndrvr_vbs, prnport_vbs = self.find_admin_scripts()
-            logger.info(f"Found scripts: prnmngr={prnmngr_vbs}, prndrvr={prndrvr_vbs}, prnport={prnport_vbs}")
-            
-            # 1) Удаляем старые принтеры
-            printers_to_remove = [
-                'Fax',
-                'Microsoft XPS Document Writer',
-                'OneNote for Windows 10',
-                "Anydesk printer",
-                prn_model_name,
-                prn_queue_name
-            ]
-            
-            # Добавляем специфичные принтеры для M2040
-            if "M2040" in model.upper():
-                printers_to_remove.extend([
-                    'Kyocera ECOSYS M2040dn',
-                    'Kyocera ECOSYS M2040dn KX'
-                ])
-            
-            for p in printers_to_remove:
-                self.run_cmd(f'cscript //nologo "{prnmngr_vbs}" -d -p "{p}"', force_cscript_unicode=True)
-            
-            # 2) Удаляем старый драйвер
-            rc, _, err = self.run_cmd(f'cscript //nologo "{prndrvr_vbs}" -d -m "{prn_model_name}" -v {arch_ver} -e "{arch_name}"')
-            if rc != 0 and ('занят' in (err or '').lower() or 'busy' in (err or '').lower() or '0x80041001' in (err or '')):
-                logger.info('Driver seems busy, restarting Spooler...')
-                self.stop_start_spooler()
-                self.run_cmd(f'cscript //nologo "{prndrvr_vbs}" -d -m "{prn_model_name}" -v {arch_ver} -e "{arch_name}"')
-            
-            # 3) Установка драйвера
-            cmd_install_drv = (
-                f'cscript //nologo "{prndrvr_vbs}" -a -m "{prn_model_name}" -v {arch_ver} '
-                f'-e "{arch_name}" -i "{inf_path}" -h "{drivers_path}"'
-            )
-            rc, _, err = self.run_cmd(cmd_install_drv)
-            if rc != 0:
+            scripts = self.find_admin_scripts()
+            logger.info(f"Found scripts: prnmngr={scripts[0]}, prndrvr={scripts[1]}, prnport={scripts[2]}")
+            
+            # 1) Удаляем старые принтеры (очередь, уже настроенная как нужно, остаётся)
+            self.report('driver', f'Установка драйвера {queue["driver"]}')
+            keep = [queue['name']] if self.queue_current(queue) else []
+            self.remove_printers(scripts, queue['remove'], keep=keep)
+            
+            # 2-3) Удаляем старый драйвер и ставим новый; при ошибке - перезапуск Spooler и повтор
+            if self.driver_current(queue):
+                logger.info(f'Driver "{queue["driver"]}" {queue["version"]} is already installed')
+            elif not self.install_driver(scripts, queue):
                 logger.info('Failed to install driver on first try, restarting Spooler...')
                 self.stop_start_spooler()
-                rc, _, err = self.run_cmd(cmd_install_drv, check=True)
-            
-            # 4) Создаем TCP RAW порт
-            self.run_cmd(f'cscript //nologo "{prnport_vbs}" -a -r "{port_name}" -h "{host}" -o raw -n {raw_port}', check=True)
-            
-            # 5) Создаем очередь печати
-            self.run_cmd(
-                f'cscript //nologo "{prnmngr_vbs}" -a -p "{prn_queue_name}" -m "{prn_model_name}" -r "{port_name}"',
-                check=True
-            )
+                self.install_driver(scripts, queue, check=True)
             
-            # 6) Делаем принтер принтером по умолчанию
-            self.run_cmd(
-                f'cscript //nologo "{prnmngr_vbs}" -t -p "{prn_queue_name}"',
-                check=True
-            )
+            # 4-6) Порт, очередь печати и принтер по умолчанию
+            self.report('configure', f'Настройка порта {queue["port"]} и очереди "{queue["name"]}"')
+            self.add_printer_queue(scripts, queue, default=True)
             
-            logger.info(f'Printer "{prn_queue_name}" installed successfully as default printer')
+            logger.info(f'Printer "{queue["name"]}" installed successfully as default printer')
             return True
             
         except Exception as e:
             logger.error(f"CMD installation error: {e}")
             return False
 
-    def install_scanner_cmd(self, ip, model, host, drivers_path):
-        """Установка сканера через CMD команды"""
+    def printer_queue(self, model, host, desc, drivers):
+        """Параметры очереди печати: из каталога моделей, host и desc - из реестра принтеров"""
+        info = model_catalog.resolve(model)
+        if not info:
+            logger.error(f"Model {model} is not in the catalog")
+            return None
+        name = f'{info.name} ({desc})' if desc else info.name
+        logger.info(f"Using {info.vendor} driver: {drivers['driver']}")
+        logger.info(f"Found INF file: {drivers['inf']}")
+        return {
+            'name': name,
+            'driver': drivers['driver'],
+            'inf': drivers['inf'],
+            'driver_root': drivers['driver_root'],
+            'version': inf_driver_version(drivers['inf']),
+            'port': host,  # Используем host как имя порта
+            'host': host,
+            # Старые очереди этой модели, установленные вручную
+            'remove': [drivers['driver'], name] + list(info.remove_queues),
+        }
+
+    def spooler_state(self):
+        """Снимок очередей, драйверов и портов - один раз за задание; None, если снять не удалось"""
+        if self._state is None:
+            self._state = SpoolerState.snapshot(self.run_cmd) or False
+        return self._state or None
+
+    def driver_current(self, queue):
+        """Драйвер очереди уже стоит той же версии, что в INF"""
+        state = self.spooler_state()
+        return bool(state and queue['version'] and state.driver_version(queue['driver']) == queue['version'])
+
+    def queue_current(self, queue):
+        """Очередь уже есть с нужными драйвером и портом, и драйвер не нужно переустанавливать"""
+        state = self.spooler_state()
+        return self.driver_current(queue) and state.printer_matches(queue['name'], queue['driver'], queue['port'])
+
+    def remove_printers(self, scripts, names, keep=()):
+        """Удаление очередей печати (и лишних системных принтеров), кроме keep; отсутствующие пропускаются"""
+        prnmngr_vbs = scripts[0]
+        names = list(dict.fromkeys(STOCK_PRINTERS_TO_REMOVE + tuple(names)))
+        state = self.spooler_state()
+        if state:
+            keep = {n.lower() for n in keep}
+            names = [p for p in names if state.has_printer(p) and p.lower() not in keep]
+        if names:
+            self.run_cmds([f'cscript //nologo "{prnmngr_vbs}" -d -p "{p}"' for p in names],
+                          force_cscript_unicode=True)
+        if state:
+            for p in names:
+                state.remove_printer(p)
+
+    def install_driver(self, scripts, queue, check=False):
+        """Переустановка драйвера очереди; False, если драйвер занят или не встал"""
+        prndrvr_vbs = scripts[1]
+        state = self.spooler_state()
+        arch = f'-v {DRIVER_ARCH_VER} -e "{DRIVER_ARCH_NAME}"'
+        # Старый драйвер удаляем, только если он есть
+        if not state or state.has_driver(queue['driver']):
+            rc, _, err = self.run_cmd(f'cscript //nologo "{prndrvr_vbs}" -d -m "{queue["driver"]}" {arch}')
+            busy = rc != 0 and ('занят' in (err or '').lower() or 'busy' in (err or '').lower() or '0x80041001' in (err or ''))
+            if busy and not check:
+                logger.info('Driver seems busy')
+                return False
+            if state and rc == 0:
+                state.remove_driver(queue['driver'])
+        rc, _, err = self.run_cmd(
+            f'cscript //nologo "{prndrvr_vbs}" -a -m "{queue["driver"]}" {arch} '
+            f'-i "{queue["inf"]}" -h "{queue["driver_root"]}"', check=check)
+        if state and rc == 0:
+            state.add_driver(queue['driver'], queue['version'])
+        return rc == 0
+
+    def add_printer_queue(self, scripts, queue, default=False):
+        """TCP RAW порт и очередь печати (если их ещё нет); default - сделать принтером по умолчанию"""
+        prnmngr_vbs, _, prnport_vbs = scripts
+        state = self.spooler_state()
+        if state and state.port_matches(queue['port'], queue['host'], RAW_PORT):
+            logger.info(f'Port "{queue["port"]}" already exists')
+        else:
+            self.run_cmd(f'cscript //nologo "{prnport_vbs}" -a -r "{queue["port"]}" -h "{queue["host"]}" -o raw -n {RAW_PORT}', check=True)
+            if state:
+                state.add_port(queue['port'], queue['host'], RAW_PORT)
+        if state and state.printer_matches(queue['name'], queue['driver'], queue['port']):
+            logger.info(f'Queue "{queue["name"]}" already exists')
+        else:
+            self.run_cmd(
+                f'cscript //nologo "{prnmngr_vbs}" -a -p "{queue["name"]}" -m "{queue["driver"]}" -r "{queue["port"]}"',
+                check=True
+            )
+            if state:
+                state.add_printer(queue['name'], queue['driver'], queue['port'])
+        if default:
+            self.set_default_printer(scripts, queue['name'])
+
+    def set_default_printer(self, scripts, name):
+        state = self.spooler_state()
+        if state and state.is_default(name):
+            return
+        self.run_cmd(f'cscript //nologo "{scripts[0]}" -t -p "{name}"', check=True)
+        if state:
+            state.set_default(name)
+
+    def install_printer_locked(self, ip, model, host, desc, drivers):
+        """install_printer_cmd под SPOOLER_LOCK"""
+        with SPOOLER_LOCK:
+            return self.install_printer_cmd(ip, model, host, desc, drivers)
+
+    def install_scanner_cmd(self, ip, model, host, drivers, packages=True):
+        """Установка сканера через CMD команды; packages=False - только настройка (TWAIN и Quick Scan уже стоят)"""
         try:
             logger.info(f"Installing scanner for {model} at {ip}")
-            
-            # Находим корневую папку архива (на уровень выше drivers_path)
-            archive_root = os.path.dirname(drivers_path)
-            
-            # Для сканера нужно установить TWAIN драйвер
-            # Ищем MSI установщик в папке TWAIN_Repack
-            twain_repack_path = os.path.join(archive_root, "TWAIN_Repack")
-            if not os.path.exists(twain_repack_path):
-                logger.error(f"TWAIN_Repack folder not found in {archive_root}")
+            if not all(run_stages(self.scanner_stages(ip, model, host, drivers, packages)).values()):
                 return False
+            logger.info(f'Scanner for {model} installed successfully')
+            return True
             
-            # Ищем MSI файл в папке TWAIN_Repack
-            msi_file = os.path.join(twain_repack_path, "KyoceraTwain+QuickScan.msi")
-            
-            if not os.path.exists(msi_file):
-                logger.error(f"MSI file not found: {msi_file}")
+        except Exception as e:
+            logger.error(f"Scanner installation error: {e}")
+            return False
+
+    def scanner_stages(self, ip, model, host, drivers, packages=True):
+        """
+        Стадии установки сканера для run_stages: TWAIN MSI, затем настройка
+        TWAIN; копирование Quick Scan, затем ярлык - параллельно с ними
+        """
+        def install_twain():
+            # Для сканера нужно установить TWAIN драйвер из пакета сканера в архиве
+            msi_file = drivers['twain_msi']
+            if not msi_file or not os.path.exists(msi_file):
+                logger.error(f"No TWAIN installer for {model} in drivers archive")
                 return False
             
             # Запускаем установку TWAIN драйвера через MSI
             logger.info(f"Running TWAIN MSI installer: {msi_file}")
-            # Используем /passive параметр как указано
-            self.run_cmd(f'"{msi_file}" /passive', check=False)
-            
+            self.report('driver', 'Установка драйвера сканера')
+            # Используем /passive параметр как указано; два MSI одновременно Windows не ставит
+            with MSI_LOCK:
+                self.run_cmd(f'"{msi_file}" /passive', check=False)
+
+        def configure_twain():
             # Создаем конфигурационные файлы TWAIN
+            self.report('configure', 'Настройка сканера')
             self.create_twain_config_files(host, model)
-            
-            # Устанавливаем Quick Scan приложение
-            quick_scan_path = os.path.join(archive_root, "Quick Scan")
-            if os.path.exists(quick_scan_path):
-                # Копируем Quick Scan в Program Files
-                program_files = os.environ.get('ProgramFiles', 'C:\\Program Files')
-                target_path = os.path.join(program_files, "Kyocera", "Quick Scan")
-                
+
+        if not packages:
+            return {'twain_config': (configure_twain, [])}
+        stages = {
+            'twain_msi': (install_twain, []),
+            'twain_config': (configure_twain, ['twain_msi']),
+        }
+
+        # Устанавливаем Quick Scan приложение
+        quick_scan_path = drivers['quick_scan']
+        if quick_scan_path and os.path.exists(quick_scan_path):
+            # Копируем Quick Scan в Program Files
+            program_files = os.environ.get('ProgramFiles', 'C:\\Program Files')
+            target_path = os.path.join(program_files, "Kyocera", "Quick Scan")
+
+            def copy_quick_scan():
                 logger.info(f"Installing Quick Scan to {target_path}")
                 self.run_cmd(f'xcopy "{quick_scan_path}" "{target_path}" /E /I /Y', check=False)
-                
+
+            def create_shortcut():
                 # Создаем ярлык на рабочем столе
                 desktop = os.path.join(os.environ['USERPROFILE'], 'Desktop')
                 shortcut_path = os.path.join(desktop, "Quick Scan.lnk")
@@ -445,13 +1408,10 @@ class PluginHandler(BaseHTTPRequestHandler):
                 $Shortcut.Save()
                 '''
                 self.run_cmd(f'powershell -Command "{ps_cmd}"')
-            
-            logger.info(f'Scanner for {model} installed successfully')
-            return True
-            
-        except Exception as e:
-            logger.error(f"Scanner installation error: {e}")
-            return False
+
+            stages['quick_scan'] = (copy_quick_scan, [])
+            stages['quick_scan_shortcut'] = (create_shortcut, ['quick_scan'])
+        return stages
 
     def create_twain_config_files(self, host, model):
         """Создание конфигурационных файлов TWAIN"""
@@ -551,58 +1511,274 @@ RegNum = 1
 
     def run_cmd(self, cmd, check=False, force_cscript_unicode=False):
         """Выполнение CMD команды"""
-        use_unicode = False
-        cmd_str = cmd
-        if force_cscript_unicode and cmd.strip().lower().startswith('cscript'):
-            if ' //u' not in cmd.lower():
-                cmd_str = cmd.replace('cscript', 'cscript //U', 1)
-            use_unicode = True
-
-        logger.info(f'RUN: {cmd_str}')
-        
-        # Скрываем окна дочерних процессов
-        si = subprocess.STARTUPINFO()
-        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        si.wShowWindow = 0  # SW_HIDE
-        
-        proc = subprocess.run(
-            cmd_str,
-            capture_output=True,
-            shell=True,
-            startupinfo=si,
-            creationflags=0x08000000  # CREATE_NO_WINDOW
-        )
-        
-        if use_unicode:
-            stdout = proc.stdout.decode('utf-16le', errors='replace') if proc.stdout else ''
-            stderr = proc.stderr.decode('utf-16le', errors='replace') if proc.stderr else ''
+        return self.run_cmds([cmd], check, force_cscript_unicode)[0]
+
+    def run_cmds(self, cmds, check=False, force_cscript_unicode=False):
+        """Выполнение нескольких CMD команд за одно обращение к оболочке; результат по каждой"""
+        prepared = []
+        for cmd in cmds:
+            use_unicode = False
+            cmd_str = cmd
+            if force_cscript_unicode and cmd.strip().lower().startswith('cscript'):
+                if ' //u' not in cmd.lower():
+                    cmd_str = cmd.replace('cscript', 'cscript //U', 1)
+                use_unicode = True
+            logger.info(f'RUN: {cmd_str}')
+            prepared.append((cmd_str, use_unicode))
+
+        raw = get_command_backend().run_many([cmd_str for cmd_str, _ in prepared])
+
+        results = []
+        for (cmd_str, use_unicode), (returncode, out, err) in zip(prepared, raw):
+            if use_unicode:
+                stdout = out.decode('utf-16le', errors='replace') if out else ''
+                stderr = err.decode('utf-16le', errors='replace') if err else ''
+            else:
+                stdout = out.decode(errors='replace') if out else ''
+                stderr = err.decode(errors='replace') if err else ''
+
+            if stdout:
+                # Безопасное логирование - убираем проблемные символы
+                clean_stdout = stdout.strip().encode('ascii', errors='ignore').decode('ascii')
+                if clean_stdout:
+                    logger.info(clean_stdout)
+            
+            if stderr:
+                clean_stderr = stderr.strip().encode('ascii', errors='ignore').decode('ascii')
+                if clean_stderr:
+                    logger.info(clean_stderr)
+
+            if check and returncode != 0:
+                raise RuntimeError(f'Command failed with code {returncode}')
+            results.append((returncode, stdout, stderr))
+        return results
+
+    def stop_start_spooler(self):
+        """Перезапуск диспетчера печати: ждём фактической остановки и запуска, а не фиксированное время"""
+        with SPOOLER_LOCK:
+            logger.info('Restarting print spooler...')
+            try:
+                timings = self.services.restart('Spooler')
+            except (TimeoutError, RuntimeError) as e:
+                logger.error(f"Spooler restart failed: {e}")
+                return None
+            logger.info(f"Spooler restarted: stop {timings['stop']:.2f}s, start {timings['start']:.2f}s")
+            return timings
+
+
+class InstallJob:
+    """Задание на установку: состояние и ход по шагам JOB_STEPS"""
+
+    def __init__(self, data, kind='single'):
+        self.id = uuid.uuid4().hex[:12]
+        self.data = data
+        self.kind = kind  # 'single' - одна установка, 'batch' - список data['items']
+        self.state = 'queued'  # queued -> running -> succeeded | failed
+        self.step = None
+        self.message = 'В очереди'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.history = []
+        self.results = None  # для пакетной установки - результат по каждому элементу
+        self._lock = threading.Lock()
+
+    def report(self, step, message):
+        with self._lock:
+            # Стадии идут параллельно: шаг задания только растёт, сообщение - последнее
+            if self.step is None or JOB_STEPS.index(step) >= JOB_STEPS.index(self.step):
+                self.step = step
+            self.message = message
+            self.history.append({'time': time.time(), 'step': step, 'message': message})
+
+    def start(self):
+        with self._lock:
+            self.state = 'running'
+            self.started = time.time()
+
+    def finish(self, success, message):
+        with self._lock:
+            self.state = 'succeeded' if success else 'failed'
+            self.finished = time.time()
+        self.report('done' if success else self.step or 'download', message)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'state': self.state,
+                'success': {'succeeded': True, 'failed': False}.get(self.state),
+                'step': self.step,
+                'step_index': JOB_STEPS.index(self.step) + 1 if self.step else 0,
+                'steps': len(JOB_STEPS),
+                'message': self.message,
+                'ip': self.data.get('ip'),
+                'model': self.data.get('model'),
+                'variant': self.data.get('variant'),
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'history': list(self.history),
+                'results': self.results,
+            }
+
+
+class JobQueue:
+    """Очередь установок: пул из INSTALL_WORKERS потоков, завершённые задания хранятся JOB_TTL секунд"""
+
+    def __init__(self, workers=INSTALL_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='install')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, data, kind='single'):
+        job = InstallJob(data, kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished > JOB_TTL:
+                del self._jobs[job_id]
+
+    def _run(self, job):
+        job.start()
+        data = job.data
+        if job.kind == 'batch':
+            self._run_batch(job)
+            return
+        try:
+            installer = PrinterInstaller(progress=job.report)
+            success = installer.perform_installation(
+                data['ip'], data['model'], data['variant'], data.get('host', ''), data.get('desc', ''))
+        except Exception as e:
+            logger.error(f"Install job {job.id} error: {e}")
+            success = False
+        if success:
+            job.finish(True, f"{data['model']} установлен")
         else:
-            stdout = proc.stdout.decode(errors='replace') if proc.stdout else ''
-            stderr = proc.stderr.decode(errors='replace') if proc.stderr else ''
-
-        if stdout:
-            # Безопасное логирование - убираем проблемные символы
-            clean_stdout = stdout.strip().encode('ascii', errors='ignore').decode('ascii')
-            if clean_stdout:
-                logger.info(clean_stdout)
+            job.finish(False, f"Не удалось установить {data['model']}: {job.message}")
+
+
+    def _run_batch(self, job):
+        items = job.data['items']
+        try:
+            job.results = PrinterInstaller(progress=job.report).perform_batch(items)
+        except Exception as e:
+            logger.error(f"Batch job {job.id} error: {e}")
+            job.results = [{'ip': it['ip'], 'model': it['model'], 'variant': it['variant'],
+                            'success': False, 'error': str(e)} for it in items]
+        ok = sum(r['success'] for r in job.results)
+        if ok == len(items):
+            job.finish(True, f"Установлено: {ok} из {len(items)}")
+        else:
+            job.finish(False, f"Установлено: {ok} из {len(items)}, ошибок: {len(items) - ok}")
+
+
+JOBS = JobQueue()
+
+
+class PluginHandler(BaseHTTPRequestHandler):
+    # Keep-alive для пула соединений веб-сервера; простаивающее соединение закрывается через timeout
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+    disable_nagle_algorithm = True  # заголовки и тело уходят отдельными send(); без этого +40 мс на ответ
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.client_address[0]} - {format % args}")
+
+    def do_GET(self):
+        """Обработка GET запросов"""
+        parsed = urlparse(self.path)
         
-        if stderr:
-            clean_stderr = stderr.strip().encode('ascii', errors='ignore').decode('ascii')
-            if clean_stderr:
-                logger.info(clean_stderr)
+        if parsed.path == "/status":
+            # Проверка статуса службы
+            response = {"status": "running", "version": "1.0.0"}
+            self.send_json_response(response)
+            return
+            
+        elif parsed.path == "/health":
+            # Health check
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"OK")
+            return
 
-        if check and proc.returncode != 0:
-            raise RuntimeError(f'Command failed with code {proc.returncode}')
-        return proc.returncode, stdout, stderr
+        elif parsed.path == "/jobs":
+            # Последние задания на установку
+            jobs = sorted(JOBS.jobs(), key=lambda j: j.created, reverse=True)
+            self.send_json_response({"jobs": [j.to_dict() for j in jobs]})
+            return
 
-    def stop_start_spooler(self):
-        """Перезапуск диспетчера печати"""
-        logger.info('Restarting print spooler...')
-        self.run_cmd('sc stop Spooler')
-        time.sleep(2)
-        self.run_cmd('sc start Spooler')
-        time.sleep(2)
+        elif parsed.path.startswith("/jobs/"):
+            # Ход установки
+            job = JOBS.get(parsed.path[len("/jobs/"):])
+            if not job:
+                self.send_json_response({"error": "Job not found"}, status=404)
+                return
+            self.send_json_response(job.to_dict())
+            return
+            
+        else:
+            self.send_error(404, "Not Found")
 
+    def do_POST(self):
+        """Обработка POST запросов"""
+        parsed = urlparse(self.path)
+        
+        if parsed.path == "/install":
+            self.handle_install()
+            return
+        elif parsed.path == "/install/batch":
+            self.handle_install(batch=True)
+            return
+        else:
+            self.send_error(404, "Not Found")
+
+    def handle_install(self, batch=False):
+        """Постановка установки (batch - списка {"items": [...]}) в очередь; ход установки - GET /jobs/{id}"""
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            
+            logger.info(f"Install request: {data}")
+            
+            # Валидация данных
+            required_fields = ['ip', 'model', 'variant']
+            items = data.get('items') if batch else [data]
+            if not isinstance(items, list) or not items:
+                self.send_json_response({"success": False, "error": "items must be a non-empty list"}, status=400)
+                return
+            for item in items:
+                for field in required_fields:
+                    if not isinstance(item, dict) or field not in item:
+                        self.send_json_response({"success": False, "error": f"Missing required field: {field}"}, status=400)
+                        return
+            
+            job = JOBS.submit(data, kind='batch' if batch else 'single')
+            response = {"success": True, "job_id": job.id, "status_url": f"/jobs/{job.id}", "job": job.to_dict()}
+            self.send_json_response(response, status=202)
+            
+        except Exception as e:
+            logger.error(f"Install error: {e}")
+            response = {"success": False, "error": str(e)}
+            self.send_json_response(response, status=500)
 
     def send_json_response(self, data, status=200):
         """Отправка JSON ответа"""
@@ -622,6 +1798,17 @@ def is_port_available(port):
     except OSError:
         return False
 
+def load_model_catalog():
+    """Каталог моделей с сервера, чтобы новые модели не требовали пересборки плагина"""
+    try:
+        with urllib.request.urlopen(f"{SERVER_URL}/files-db.json", timeout=5) as resp:
+            catalog = model_catalog.ModelCatalog(json.loads(resp.read().decode('utf-8')))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Using built-in model catalog: {e}")
+        return
+    model_catalog.set_catalog(catalog)
+    logger.info(f"Loaded model catalog from server: {len(catalog.models)} models")
+
 def main():
     """Основная функция"""
     PORT = 8081
@@ -631,8 +1818,10 @@ def main():
         logger.error(f"Port {PORT} is already in use")
         sys.exit(1)
     
+    load_model_catalog()
+    
     # Создаем HTTP сервер
-    server = HTTPServer(('127.0.0.1', PORT), PluginHandler)
+    server = ThreadingHTTPServer(('127.0.0.1', PORT), PluginHandler)
     
     logger.info(f"PrinterPlugin service starting on port {PORT}")
     logger.info("Service is ready to handle installation requests")
@@ -645,6 +1834,7 @@ def main():
         logger.error(f"Service error: {e}")
     finally:
         server.server_close()
+        set_command_backend(None)
         logger.info("Service shutdown complete")
 
 if __name__ == "__main__":
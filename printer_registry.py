@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Реестр принтеров в SQLite: поиск по ip, host, model, desc и can_scan с постраничной выдачей
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, "printers.db")
+MAX_PAGE = 1000  # больше записей за один запрос не отдаём
+
+FIELDS = ("ip", "host", "model", "desc", "can_scan")
+FILTERS = ("ip", "host", "model", "desc")
+
+# desc - ключевое слово SQL, поэтому имена колонок в запросах в кавычках
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS printers (
+    id       INTEGER PRIMARY KEY,
+    ip       TEXT NOT NULL UNIQUE,
+    host     TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    model    TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    "desc"   TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    can_scan INTEGER NOT NULL DEFAULT 0,
+    source   TEXT NOT NULL DEFAULT 'manual',
+    added    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS printers_host ON printers(host);
+CREATE INDEX IF NOT EXISTS printers_model ON printers(model);
+CREATE INDEX IF NOT EXISTS printers_desc ON printers("desc");
+"""
+
+
+def check_fields(fields):
+    """ValueError, если у полей принтера не тот тип: host/model/desc - строки, can_scan - bool"""
+    for key in ("host", "model", "desc"):
+        if key in fields and not isinstance(fields[key], str):
+            raise ValueError(f"{key} must be a string")
+    if "can_scan" in fields and not isinstance(fields["can_scan"], bool):
+        raise ValueError("can_scan must be true or false")
+
+
+def _row(row) -> dict:
+    return {"ip": row["ip"], "host": row["host"], "model": row["model"],
+            "desc": row["desc"], "can_scan": bool(row["can_scan"])}
+
+
+class PrinterRegistry:
+    """Соединение с базой открывается отдельно в каждом потоке сервера"""
+
+    def __init__(self, path=DB_PATH, seed=()):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            if not conn.execute("SELECT 1 FROM printers LIMIT 1").fetchone():
+                for p in seed:
+                    self._insert(conn, p, "seed")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _insert(conn, printer, source):
+        try:
+            conn.execute(
+                "INSERT INTO printers (ip, host, model, \"desc\", can_scan, source, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (printer["ip"], printer.get("host", ""), printer.get("model", ""), printer.get("desc", ""),
+                 int(bool(printer.get("can_scan"))), source, time.time()))
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE" in str(e):
+                return False  # такой IP уже есть
+            raise
+        return True
+
+    def query(self, filters=None, limit=None, offset=0):
+        """(записи, всего подходящих) с фильтрами по точному совпадению полей"""
+        where, args = [], []
+        for key, value in (filters or {}).items():
+            if key in FILTERS:
+                where.append(f'"{key}" = ?')
+                args.append(value)
+            elif key == "can_scan":
+                where.append("can_scan = ?")
+                args.append(int(bool(value)))
+            else:
+                raise ValueError(f"Unknown filter: {key}")
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        limit = MAX_PAGE if limit is None else max(0, min(int(limit), MAX_PAGE))
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM printers{clause}", args).fetchone()[0]
+        rows = conn.execute(f"SELECT * FROM printers{clause} ORDER BY id LIMIT ? OFFSET ?",
+                            args + [limit, max(0, int(offset))]).fetchall()
+        return [_row(r) for r in rows], total
+
+    def get(self, ip):
+        row = self._conn().execute("SELECT * FROM printers WHERE ip = ?", (ip,)).fetchone()
+        return _row(row) if row else None
+
+    def ips(self) -> list:
+        return [r[0] for r in self._conn().execute("SELECT ip FROM printers ORDER BY id")]
+
+    def add(self, printer, source="manual") -> bool:
+        """Добавляет принтер, если его IP ещё нет в реестре"""
+        with self._conn() as conn:
+            return self._insert(conn, printer, source)
+
+    def update(self, ip, fields) -> bool:
+        """Меняет поля принтера; False, если принтера нет"""
+        changes = {k: v for k, v in fields.items() if k in FIELDS and k != "ip"}
+        if "can_scan" in changes:
+            changes["can_scan"] = int(bool(changes["can_scan"]))
+        if not changes:
+            return self.get(ip) is not None
+        sets = ", ".join(f'"{k}" = ?' for k in changes)
+        with self._conn() as conn:
+            return conn.execute(f"UPDATE printers SET {sets} WHERE ip = ?", list(changes.values()) + [ip]).rowcount == 1
+
+    def delete(self, ip) -> bool:
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM printers WHERE ip = ?", (ip,)).rowcount == 1
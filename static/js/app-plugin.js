@@ -5,6 +5,15 @@
   const E = (...a)=>{ try{ console.error('[plugin]', ...a); }catch{} };
 
   let pluginInstalled = false;
+  const JOB_POLL_MS = 700;  // опрос хода установки, если нет потока /api/events
+  const live = () => (window.LiveEvents && window.LiveEvents.readyState !== EventSource.CLOSED) ? window.LiveEvents : null;
+
+  // Доступность плагина приходит в потоке событий, отдельный опрос не нужен
+  if (live()) {
+    const setInstalled = installed => { pluginInstalled = !!installed; L('Plugin status:', pluginInstalled); };
+    live().addEventListener('snapshot', e => setInstalled(JSON.parse(e.data).plugin.installed));
+    live().addEventListener('plugin', e => setInstalled(JSON.parse(e.data).installed));
+  }
 
   async function checkPluginStatus() {
     try {
@@ -49,7 +58,10 @@
         throw new Error(`HTTP ${response.status}: ${response.statusText}`);
       }
 
-      const result = await response.json();
+      // Плагин ставит установку в очередь; дальше следим за заданием
+      const queued = await response.json();
+      L('Install job:', queued);
+      const result = await waitInstallJob(queued.job_id, progressModal);
       L('Install result:', result);
 
       // Скрываем прогресс и показываем результат
@@ -58,7 +70,7 @@
       if (result.success) {
         showNotification('✅ Принтер успешно установлен!', 'success');
       } else {
-        showNotification('❌ Ошибка установки: ' + (result.error || 'Неизвестная ошибка'), 'error');
+        showNotification('❌ Ошибка установки: ' + (result.message || result.error || 'Неизвестная ошибка'), 'error');
       }
     } catch (error) {
       E('Install error:', error);
@@ -265,52 +277,80 @@
       content.style.transform = 'scale(1)';
     }, 100);
     
-    // Симуляция прогресса
-    simulateProgress(modal, printerData);
-    
     return modal;
   }
   
-  function simulateProgress(modal, printerData) {
+  function jobFinished(job) {
+    return job.state === 'succeeded' || job.state === 'failed';
+  }
+
+  async function waitInstallJob(jobId, modal) {
+    const events = live();
+    if (events) {
+      // Ход установки приходит событиями job (и в снимке после переподключения)
+      return new Promise((resolve, reject) => {
+        let done = false;
+        const finish = (result, settle = resolve) => {
+          if (done) return;
+          done = true;
+          events.removeEventListener('job', onEvent);
+          events.removeEventListener('snapshot', onSnapshot);
+          events.removeEventListener('error', onError);
+          settle(result);
+        };
+        const onJob = job => {
+          if (done || job.id !== jobId) return;
+          updateInstallProgress(modal, job);
+          if (jobFinished(job)) finish(job);
+        };
+        const onEvent = e => onJob(JSON.parse(e.data));
+        const onSnapshot = e => (JSON.parse(e.data).jobs || []).forEach(onJob);
+        const onError = () => {
+          if (events.readyState === EventSource.CLOSED) finish(pollInstallJob(jobId, modal));
+        };
+        events.addEventListener('job', onEvent);
+        events.addEventListener('snapshot', onSnapshot);
+        events.addEventListener('error', onError);
+        // Состояние на момент подписки: событие могло прийти, пока ждали ответа /api/install
+        fetchInstallJob(jobId).then(onJob, error => finish(error, reject));
+      });
+    }
+    return pollInstallJob(jobId, modal);
+  }
+
+  async function fetchInstallJob(jobId) {
+    const response = await fetch(`/api/install/jobs/${encodeURIComponent(jobId)}`, { cache: 'no-store' });
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    return response.json();
+  }
+
+  async function pollInstallJob(jobId, modal) {
+    // Без потока событий опрашиваем задание, пока плагин не закончит установку
+    while (true) {
+      const job = await fetchInstallJob(jobId);
+      updateInstallProgress(modal, job);
+      if (jobFinished(job)) {
+        return job;
+      }
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+    }
+  }
+
+  function updateInstallProgress(modal, job) {
     const steps = modal.querySelectorAll('.step');
     const progressFill = modal.querySelector('.progress-fill');
     const progressText = modal.querySelector('.progress-text');
-    
-    const stepTexts = [
-      'Загрузка драйверов с сервера...',
-      'Установка драйверов принтера...',
-      'Настройка порта и очереди печати...',
-      'Завершение установки...'
-    ];
-    
-    let currentStep = 0;
-    
-    function nextStep() {
-      if (currentStep < steps.length) {
-        // Помечаем предыдущий шаг как завершенный
-        if (currentStep > 0) {
-          steps[currentStep - 1].classList.remove('active');
-          steps[currentStep - 1].classList.add('completed');
-        }
-        
-        // Активируем текущий шаг
-        if (currentStep < steps.length) {
-          steps[currentStep].classList.add('active');
-          progressText.textContent = stepTexts[currentStep];
-          progressFill.style.width = `${((currentStep + 1) / steps.length) * 100}%`;
-        }
-        
-        currentStep++;
-        
-        // Продолжаем через случайный интервал (2-4 секунды)
-        if (currentStep < steps.length) {
-          setTimeout(nextStep, 2000 + Math.random() * 2000);
-        }
-      }
-    }
-    
-    // Запускаем первый шаг
-    setTimeout(nextStep, 500);
+
+    // step_index: 0 - в очереди, 1..steps - текущий шаг установки
+    const current = job.state === 'succeeded' ? steps.length + 1 : job.step_index;
+    steps.forEach((step, i) => {
+      step.classList.toggle('completed', i + 1 < current);
+      step.classList.toggle('active', i + 1 === current);
+    });
+    progressText.textContent = job.message || 'Подготовка к установке...';
+    progressFill.style.width = `${(Math.min(current, steps.length) / steps.length) * 100}%`;
   }
   
   function hideInstallProgress(modal) {
@@ -6,20 +6,32 @@ const splash = qs('#splash');
 const bar = qs('#bar');
 
 let DATA = [];
+let SERVER_NOW = 0;
+
+/* Сколько времени назад сервер проверял принтер */
+function checkedAgo(p) {
+  if (!p.checked || !SERVER_NOW) return '';
+  const sec = Math.max(0, Math.round(SERVER_NOW - p.checked));
+  return sec < 60 ? ` (проверено ${sec} с назад)` : ` (проверено ${Math.round(sec / 60)} мин назад)`;
+}
 
 /* Рендер одной строки */
 
-function rowTpl(p) {
+function badgeTpl(p) {
   const dotClass = p.online ? 'ok' : 'warn';
-  const tip = p.online ? 'Найден в сети' : 'Не найден в текущем сканировании';
-  const canScan = !!p.can_scan;
+  const tip = (p.online ? 'Найден в сети' : 'Не найден в текущем сканировании') + checkedAgo(p);
   return `
-  <div class="row" data-blob="${[p.ip,p.model,p.desc].join(' ').toLowerCase()}">
-    <div class="col status">
       <span class="badge" title="${tip}">
         <span class="dot ${dotClass}"></span>
         ${p.online ? 'Онлайн' : 'Оффлайн'}
-      </span>
+      </span>`;
+}
+
+function rowTpl(p) {
+  const canScan = !!p.can_scan;
+  return `
+  <div class="row" data-ip="${p.ip||''}" data-blob="${[p.ip,p.model,p.desc].join(' ').toLowerCase()}">
+    <div class="col status">${badgeTpl(p)}
     </div>
     <div class="col ip">${p.ip||''}</div>
     <div class="col model">${p.model||''}</div>
@@ -53,18 +65,8 @@ search.addEventListener('input', e=>{
   });
 });
 
-/* Примитивная имитация сканирования: прогресс-бар */
-qs('#rescan')?.addEventListener('click', async ()=>{
-  bar.style.width = '0%';
-  splash.classList.remove('hidden');
-  for (let i=0;i<=100;i+=7){
-    await new Promise(r=>setTimeout(r, 40));
-    bar.style.width = i+'%';
-  }
-  splash.classList.add('hidden');
-  // заново отрисуем текущие (или перезапросим — тут просто переотрисую для эффекта)
-  render(DATA);
-});
+/* Пересканирование: сервер заново опрашивает принтеры */
+qs('#rescan')?.addEventListener('click', () => scan(true));
 
 
 /* Слежение за мышью — для блика на кнопке */
@@ -79,7 +81,7 @@ document.addEventListener('pointermove', e=>{
 
 /* ==== ИНИЦИАЛИЗАЦИЯ / ДАННЫЕ ==== */
 
-async function scan() {
+async function scan(refresh = false) {
   try {
     // показать "прогресс"
     splash.classList.remove('hidden');
@@ -92,9 +94,10 @@ async function scan() {
       bar.style.width = prog + '%';
     }, 40);
 
-    const res = await fetch('/api/scan', { cache: 'no-store' });
+    const res = await fetch(refresh ? '/api/scan?refresh=1' : '/api/scan', { cache: 'no-store' });
     if (!res.ok) throw new Error(`HTTP ${res.status}`);
-    const { items } = await res.json();
+    const { items, now } = await res.json();
+    SERVER_NOW = now || 0;
 
     DATA = Array.isArray(items) ? items : [];
     render(DATA);
@@ -110,3 +113,31 @@ async function scan() {
   }
 }
 scan();
+
+/* ==== ЖИВЫЕ ОБНОВЛЕНИЯ ==== */
+
+/* Один поток /api/events на вкладку: сервер присылает только изменения */
+const LIVE = window.EventSource ? new EventSource('/api/events') : null;
+window.LiveEvents = LIVE;
+
+function applyPrinterStatus(ip, st) {
+  const p = DATA.find(x => x.ip === ip);
+  if (!p) return;
+  p.online = st.online;
+  p.checked = st.checked;
+  const cell = tbody.querySelector(`.row[data-ip="${ip}"] .col.status`);
+  if (cell) cell.innerHTML = badgeTpl(p);
+}
+
+if (LIVE) {
+  LIVE.addEventListener('snapshot', e => {
+    const { now, printers } = JSON.parse(e.data);
+    SERVER_NOW = now || SERVER_NOW;
+    Object.entries(printers || {}).forEach(([ip, st]) => applyPrinterStatus(ip, st));
+  });
+  LIVE.addEventListener('printer', e => {
+    const st = JSON.parse(e.data);
+    SERVER_NOW = Math.max(SERVER_NOW, st.checked || 0);
+    applyPrinterStatus(st.ip, st);
+  });
+}
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Статические файлы веб-интерфейса из памяти: при запуске каждый файл
+хэшируется, для него заранее готовятся gzip (и brotli, если установлен)
+варианты, а ссылки в HTML заменяются на адреса с отпечатком содержимого
+(/js/app.3f2a9c1b7d4e.js), которые кэшируются браузером навсегда.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+
+try:
+    import brotli  # необязательно: pip install brotli
+except ImportError:
+    brotli = None
+
+ASSET_MAX_BYTES = 1024 * 1024  # файлы больше (установщики и т.п.) отдаются с диска
+SKIP_DIRS = ("publish",)
+FINGERPRINT_LEN = 12
+MIN_SAVING = 0.9  # сжатый вариант храним, только если он меньше 90% исходного
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"  # каждый раз с If-None-Match, в ответ обычно 304
+
+LINK_RE = re.compile(r'''(\b(?:src|href)\s*=\s*["'])([^"'#]+)(["'])''', re.IGNORECASE)
+
+
+class Asset:
+    """Файл в памяти: исходное содержимое, сжатые варианты и ETag"""
+
+    def __init__(self, url, body, content_type):
+        self.url = url
+        self.content_type = content_type
+        self.body = body
+        self.hash = hashlib.sha256(body).hexdigest()[:FINGERPRINT_LEN]
+        self.etag = f'"{self.hash}"'
+        self.encodings = {}
+        if content_type.startswith(("text/", "application/javascript", "application/json", "image/svg")):
+            variants = {"gzip": gzip.compress(body, 9, mtime=0)}
+            if brotli:
+                variants["br"] = brotli.compress(body)
+            self.encodings = {enc: data for enc, data in variants.items() if len(data) < len(body) * MIN_SAVING}
+
+    @property
+    def fingerprinted_url(self):
+        base, ext = posixpath.splitext(self.url)
+        return f"{base}.{self.hash}{ext}"
+
+    def variant(self, accept_encoding):
+        """(кодировка или None, тело, ETag) для заголовка Accept-Encoding"""
+        accepted = {e.split(";")[0].strip().lower() for e in (accept_encoding or "").split(",")}
+        for enc in ("br", "gzip"):
+            if enc in self.encodings and enc in accepted:
+                return enc, self.encodings[enc], f'"{self.hash}-{enc}"'
+        return None, self.body, self.etag
+
+    def matches(self, if_none_match):
+        """If-None-Match совпадает с любым вариантом этого содержимого"""
+        return if_none_match.strip() == "*" or f'"{self.hash}' in if_none_match
+
+
+class AssetPipeline:
+    """
+    Каталог статики в памяти: get(url) -> (Asset, Cache-Control) для обычного
+    адреса и адреса с отпечатком. Загружается при первом обращении или load().
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._assets = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        assets = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if os.path.getsize(path) > ASSET_MAX_BYTES:
+                    continue
+                url = "/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if content_type.startswith("text/") or content_type == "application/javascript":
+                    content_type += "; charset=utf-8"
+                with open(path, "rb") as f:
+                    assets[url] = Asset(url, f.read(), content_type)
+
+        # Ссылки в HTML - на адреса с отпечатком; сама страница перепроверяется каждый раз
+        for url, asset in list(assets.items()):
+            if asset.content_type.startswith("text/html"):
+                assets[url] = Asset(url, self._rewrite_links(asset, assets), asset.content_type)
+
+        table = {}
+        for url, asset in assets.items():
+            table[url] = (asset, REVALIDATE)
+            table[asset.fingerprinted_url] = (asset, IMMUTABLE)
+            if posixpath.basename(url) == "index.html":
+                table[posixpath.dirname(url).rstrip("/") + "/"] = (asset, REVALIDATE)
+        self._assets = table
+        return self
+
+    @staticmethod
+    def _rewrite_links(page, assets):
+        base = posixpath.dirname(page.url)
+
+        def replace(m):
+            link = m.group(2)
+            if "://" in link or link.startswith("//"):
+                return m.group(0)
+            path = link.split("?", 1)[0]
+            url = path if path.startswith("/") else posixpath.normpath(posixpath.join(base, path))
+            asset = assets.get(url)
+            if not asset:
+                return m.group(0)
+            return m.group(1) + asset.fingerprinted_url + m.group(3)
+
+        return LINK_RE.sub(replace, page.body.decode("utf-8")).encode("utf-8")
+
+    def get(self, url):
+        """(Asset, Cache-Control) или None, если файла нет в памяти"""
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self.load()
+        return self._assets.get(url)